@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""
+This module benchmarks the redaction done by `filter_datum` and
+`RedactingFormatter.format`.
+
+Synthetic records are generated for every combination of the number of
+redacted fields, message length, separator and match density (the
+share of `key=value` pairs in a message that are PII fields). For each
+scenario it reports ops/sec and per-record latency percentiles.
+
+Results can be saved as a baseline and later runs compared against it:
+
+    ./bench_redaction.py --save-baseline baseline.json
+    ./bench_redaction.py --compare baseline.json
+
+Author: Okeomasilachi
+"""
+
+
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+from itertools import product
+from typing import Callable, Dict, List
+
+from filtered_logger import RedactingFormatter, filter_datum
+
+
+FIELD_COUNTS = (1, 5, 20)
+MESSAGE_LENGTHS = (64, 512, 4096)
+SEPARATORS = (";", "|")
+DENSITIES = (0.0, 0.2, 1.0)
+
+
+def make_fields(count: int) -> List[str]:
+    """Returns `count` distinct PII field names"""
+    base = ['name', 'email', 'phone', 'password', 'ssn']
+    return (base + ["pii{}".format(i) for i in range(count)])[:count]
+
+
+def make_message(fields: List[str], length: int, separator: str,
+                 density: float, rng: random.Random) -> str:
+    """
+    Builds a message of about `length` characters made of `key=value`
+    pairs, where a `density` share of the keys are PII fields.
+    """
+    parts = []
+    size = 0
+    while size < length:
+        if fields and rng.random() < density:
+            key = rng.choice(fields)
+        else:
+            key = "attr{}".format(rng.randrange(100))
+        value = "".join(rng.choice("abcdefghij0123456789")
+                        for _ in range(rng.randint(4, 16)))
+        part = "{}={}{} ".format(key, value, separator)
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Returns the nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1,
+                max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(func: Callable, inputs: List, repeat: int) -> Dict[str, float]:
+    """Times `func` on every input and summarizes the latencies"""
+    latencies = []
+    clock = time.perf_counter_ns
+    start = clock()
+    for _ in range(repeat):
+        for item in inputs:
+            t0 = clock()
+            func(item)
+            latencies.append(clock() - t0)
+    total = (clock() - start) / 1e9
+    latencies.sort()
+    return {
+        'ops_per_sec': len(latencies) / total if total else 0.0,
+        'p50_us': percentile(latencies, 50) / 1000,
+        'p90_us': percentile(latencies, 90) / 1000,
+        'p99_us': percentile(latencies, 99) / 1000,
+    }
+
+
+def run(records: int = 200, repeat: int = 5,
+        seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    Runs every scenario against both `filter_datum` and
+    `RedactingFormatter.format`.
+
+    Returns:
+      dict: The measurements, keyed by scenario name.
+    """
+    results = {}
+    for count, length, separator, density in product(
+            FIELD_COUNTS, MESSAGE_LENGTHS, SEPARATORS, DENSITIES):
+        rng = random.Random(seed)
+        fields = make_fields(count)
+        messages = [make_message(fields, length, separator, density, rng)
+                    for _ in range(records)]
+        scenario = "fields={} length={} sep={} density={}".format(
+            count, length, separator, density)
+
+        results["filter_datum " + scenario] = measure(
+            lambda message: filter_datum(fields, "***", message, separator),
+            messages, repeat)
+
+        formatter = RedactingFormatter(fields)
+        formatter.SEPARATOR = separator
+        log_records = [logging.LogRecord("user_data", logging.INFO, __file__,
+                                         0, message, None, None)
+                       for message in messages]
+        results["formatter " + scenario] = measure(
+            formatter.format, log_records, repeat)
+    return results
+
+
+def report(results: Dict[str, Dict[str, float]],
+           baseline: Dict[str, Dict[str, float]] = None) -> None:
+    """Prints the results, with the change against a baseline if any"""
+    for name, stats in results.items():
+        line = "{:<60} {:>12.0f} ops/s  p50={:.1f}us p90={:.1f}us " \
+            "p99={:.1f}us".format(name, stats['ops_per_sec'],
+                                  stats['p50_us'], stats['p90_us'],
+                                  stats['p99_us'])
+        if baseline and name in baseline:
+            before = baseline[name]['ops_per_sec']
+            if before:
+                line += "  ({:+.1f}% vs baseline)".format(
+                    (stats['ops_per_sec'] / before - 1) * 100)
+        print(line)
+
+
+def main() -> None:
+    """Parses the command line and runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=200,
+                        help="synthetic records per scenario")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="passes over the records per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", metavar="FILE",
+                        help="save the results to FILE")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare the results with a saved baseline")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    results = run(args.records, args.repeat, args.seed)
+    report(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Baseline saved to {}".format(args.save_baseline),
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
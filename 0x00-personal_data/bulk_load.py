@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+This module loads a CSV file of user data into the users table.
+
+The file is streamed in fixed-size chunks and each chunk is inserted
+with a single batched `executemany`, so memory use does not depend on
+the size of the file. The progress of every chunk (row counts and
+throughput, never row values) is logged with the `user_data` logger.
+
+Usage: ./bulk_load.py [csv_file] [chunk_size]
+
+Author: Okeomasilachi
+"""
+
+
+import re
+import csv
+import sys
+import time
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+from filtered_logger import get_db, get_logger
+
+
+def read_chunks(file_path: str,
+                chunk_size: int = 1000) -> Iterator[Tuple[List[str],
+                                                          List[list]]]:
+    """
+    Streams a CSV file in chunks.
+
+    Args:
+      file_path (str): The CSV file, whose first line holds the column
+        names.
+      chunk_size (int): The number of rows per chunk.
+
+    Yields:
+      tuple: The column names and the next chunk of rows.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    with open(file_path, newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader, None)
+        if columns is None:
+            return
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                break
+            yield columns, rows
+
+
+def insert_query(columns: List[str], table: str = "users") -> str:
+    """Builds the INSERT statement for the given columns"""
+    for name in [table] + list(columns):
+        if not re.fullmatch(r"\w+", name):
+            raise ValueError("Invalid column or table name: {}".format(name))
+    return "INSERT INTO `{}` ({}) VALUES ({})".format(
+        table,
+        ", ".join("`{}`".format(column) for column in columns),
+        ", ".join(["%s"] * len(columns)))
+
+
+def bulk_load(file_path: str, chunk_size: int = 1000,
+              table: str = "users") -> int:
+    """
+    Inserts every row of a CSV file into a table, one transaction per
+    chunk.
+
+    Returns:
+      int: The number of rows inserted.
+    """
+    logger = get_logger()
+    db = get_db()
+    cursor = db.cursor()
+    query = None
+    count = 0
+    chunk_number = 0
+    start = time.monotonic()
+    try:
+        for columns, rows in read_chunks(file_path, chunk_size):
+            if query is None:
+                query = insert_query(columns, table)
+            chunk_start = time.monotonic()
+            cursor.executemany(query, rows)
+            db.commit()
+            chunk_number += 1
+            count += len(rows)
+            chunk_time = time.monotonic() - chunk_start
+            elapsed = time.monotonic() - start
+            logger.info("chunk={}; rows={}; chunk_rows/sec={:.1f}; "
+                        "total_rows={}; rows/sec={:.1f};".format(
+                            chunk_number, len(rows),
+                            len(rows) / chunk_time if chunk_time else 0.0,
+                            count, count / elapsed if elapsed else 0.0))
+    finally:
+        cursor.close()
+        db.close()
+    return count
+
+
+if __name__ == "__main__":
+    bulk_load(sys.argv[1] if len(sys.argv) > 1 else "user_data.csv",
+              int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
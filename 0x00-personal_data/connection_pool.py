@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+This module provides a small thread-safe database connection pool.
+
+Connections are created by a user supplied `connect` callable, so the
+pool works with `mysql.connector.connect` as well as with any stand-in
+object exposing `close()` and either `ping()` or `is_connected()`.
+
+Author: Okeomasilachi
+"""
+
+
+import time
+import weakref
+import threading
+from collections import deque
+from typing import Callable
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available in time"""
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled connection.
+
+    Every attribute is forwarded to the underlying connection, except
+    `close()` which hands the connection back to its pool instead of
+    closing it. A proxy garbage collected without being closed closes
+    its connection and frees its slot in the pool.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection):
+        self._pool = pool
+        self._connection = connection
+        self._finalizer = weakref.finalize(self, pool._discard, connection)
+
+    def __getattr__(self, name: str):
+        if self._connection is None:
+            raise AttributeError(
+                "Connection already returned to the pool")
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        """Returns the connection to the pool"""
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._finalizer.detach()
+            self._pool._release(connection)
+
+    def __enter__(self) -> 'PooledConnection':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Pool of reusable database connections.
+
+    Args:
+      connect (Callable): Creates a new connection.
+      size (int): The maximum number of open connections.
+      timeout (float): Seconds to wait for a free connection before
+        raising `PoolTimeout`.
+      recycle (float): Idle connections older than this many seconds
+        are closed and replaced on checkout.
+
+    Every checked out connection is health checked first; broken ones
+    are discarded and replaced by a new connection.
+    """
+
+    def __init__(self, connect: Callable, size: int = 5,
+                 timeout: float = 30.0, recycle: float = 300.0):
+        if size < 1:
+            raise ValueError("size must be a positive integer")
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = deque()
+        self._open = 0
+        self._lock = threading.Condition()
+        self.metrics = {
+            'checkouts': 0,
+            'waits': 0,
+            'created': 0,
+            'recycled': 0,
+            'discarded': 0,
+        }
+
+    def connection(self) -> PooledConnection:
+        """
+        Checks out a healthy connection, creating one if the pool has
+        room, or waiting for one to be returned otherwise.
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            waited = False
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        "No connection available after {}s".format(
+                            self.timeout))
+                if not waited:
+                    self.metrics['waits'] += 1
+                    waited = True
+                self._lock.wait(remaining)
+            self.metrics['checkouts'] += 1
+            if self._idle:
+                connection, released_at = self._idle.pop()
+            else:
+                connection, released_at = None, None
+                self._open += 1
+
+        try:
+            if connection is not None:
+                if time.monotonic() - released_at > self.recycle:
+                    self._close_quietly(connection)
+                    connection = None
+                    with self._lock:
+                        self.metrics['recycled'] += 1
+                elif not self._is_healthy(connection):
+                    self._close_quietly(connection)
+                    connection = None
+                    with self._lock:
+                        self.metrics['discarded'] += 1
+            if connection is None:
+                connection = self._connect()
+                with self._lock:
+                    self.metrics['created'] += 1
+        except BaseException:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+        return PooledConnection(self, connection)
+
+    def _release(self, connection) -> None:
+        """Puts a returned connection back in the idle queue"""
+        try:
+            if getattr(connection, 'in_transaction', False):
+                connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+            self._lock.notify()
+
+    def _discard(self, connection) -> None:
+        """Closes a checked out connection and frees its slot"""
+        self._close_quietly(connection)
+        with self._lock:
+            self._open -= 1
+            self.metrics['discarded'] += 1
+            self._lock.notify()
+
+    @staticmethod
+    def _is_healthy(connection) -> bool:
+        """Checks that the server still answers on this connection"""
+        try:
+            if hasattr(connection, 'ping'):
+                connection.ping(reconnect=False)
+                return True
+            return bool(connection.is_connected())
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(connection) -> None:
+        """Closes a connection, ignoring errors from dead connections"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        """Returns the pool metrics along with its current usage"""
+        with self._lock:
+            stats = dict(self.metrics)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+        return stats
+
+    def close_all(self) -> None:
+        """Closes every idle connection of the pool"""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+            self._open -= len(idle)
+            self._lock.notify_all()
+        for connection, _ in idle:
+            self._close_quietly(connection)
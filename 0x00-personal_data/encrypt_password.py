@@ -5,39 +5,238 @@ Model for Encrypt Password
 """
 
 
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple
+
 import bcrypt
 
 
-def hash_password(password: str) -> bytes:
+MIN_COST = 4
+MAX_COST = 31
+DEFAULT_COST = 12
+_cost = None
+_cost_lock = threading.Lock()
+
+
+def calibrate_cost(target_ms: float = 250.0, min_cost: int = MIN_COST,
+                   max_cost: int = 16) -> int:
+    """
+    Finds the highest bcrypt cost whose hashing time on this host fits
+    in the target latency.
+
+    Each extra cost unit doubles the work, so the timing measured at a
+    cost predicts the next one; the benchmark stops before running a
+    cost that would exceed the target.
+
+    Args:
+      target_ms (float): The latency budget of a single verification.
+      min_cost (int): The lowest acceptable cost, returned even when it
+        does not fit the budget.
+      max_cost (int): The highest cost to consider.
+
+    Returns:
+      int: The calibrated cost.
+    """
+    min_cost = max(min_cost, MIN_COST)
+    max_cost = min(max_cost, MAX_COST)
+    cost = min_cost
+    while cost < max_cost:
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=cost))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms * 2 > target_ms:
+            break
+        cost += 1
+    return cost
+
+
+def configure_cost(cost: int = None, target_ms: float = None) -> int:
+    """
+    Sets the cost used by `hash_password`.
+
+    Args:
+      cost (int): An explicit cost.
+      target_ms (float): Calibrate the cost for this latency budget
+        when no explicit cost is given.
+
+    Returns:
+      int: The configured cost.
+    """
+    global _cost
+    if cost is None:
+        cost = calibrate_cost(target_ms) if target_ms else DEFAULT_COST
+    if not MIN_COST <= cost <= MAX_COST:
+        raise ValueError("bcrypt cost must be between {} and {}".format(
+            MIN_COST, MAX_COST))
+    _cost = cost
+    return _cost
+
+
+def get_cost() -> int:
+    """
+    Returns the cost used by `hash_password`.
+
+    Unless `configure_cost` was called, it comes from the BCRYPT_COST
+    environment variable, or from a calibration against the
+    BCRYPT_TARGET_MS latency budget, or the bcrypt default. The
+    calibration runs once, even when several threads ask at once.
+    """
+    if _cost is None:
+        with _cost_lock:
+            if _cost is None:
+                if os.getenv("BCRYPT_COST"):
+                    return configure_cost(int(os.getenv("BCRYPT_COST")))
+                if os.getenv("BCRYPT_TARGET_MS"):
+                    return configure_cost(
+                        target_ms=float(os.getenv("BCRYPT_TARGET_MS")))
+                return configure_cost(DEFAULT_COST)
+    return _cost
+
+
+def hash_cost(hashed_password: bytes) -> int:
+    """Returns the cost a bcrypt hash was created with"""
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """Tells whether a hash uses a cost other than the configured one"""
+    return hash_cost(hashed_password) != get_cost()
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
     Hashes the given password using bcrypt.
 
     Args:
       password (str): The password to be hashed.
+      rounds (int): The bcrypt cost. Defaults to `get_cost()`.
 
     Returns:
       bytes: The hashed password.
 
     """
-    salt = bcrypt.gensalt()  # Generate a random salt
+    if rounds is None:
+        rounds = get_cost()
+    salt = bcrypt.gensalt(rounds=rounds)  # Generate a random salt
     # Hash the password with the salt
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed_password
 
 
-def is_valid(hashed_password: bytes, password: str) -> bool:
+def is_valid(hashed_password: bytes, password: str,
+             on_rehash: Callable[[bytes], None] = None) -> bool:
     """
     Check if a password matches a hashed password.
 
     Args:
       hashed_password (bytes): The hashed password to compare against.
       password (str): The password to check.
+      on_rehash (Callable): Called with a new hash of the password when
+        it matches but the stored hash uses a different cost than the
+        configured one, so the caller can store the new hash.
 
     Returns:
       bool: True if the password matches the hashed password, False otherwise.
     """
     hashed_password_str = hashed_password.decode('utf-8')
-    return bcrypt.checkpw(
+    valid = bcrypt.checkpw(
         password.encode('utf-8'),
         hashed_password_str.encode('utf-8')
     )
+    if valid and on_rehash is not None and needs_rehash(hashed_password):
+        on_rehash(hash_password(password))
+    return valid
+
+
+def _executor(use_processes: bool, workers: int):
+    """Returns a pool executor sized to the machine's cores by default"""
+    workers = workers or os.cpu_count() or 1
+    if use_processes:
+        return ProcessPoolExecutor(max_workers=workers), workers
+    return ThreadPoolExecutor(max_workers=workers), workers
+
+
+def _ordered_map(func, items: Iterable, use_processes: bool,
+                 workers: int, stats: dict) -> Iterator:
+    """
+    Applies `func` to each item on a worker pool and yields the results
+    in input order.
+
+    At most a few tasks per worker are in flight at once, so the input
+    iterable is consumed lazily and results are streamed back as soon
+    as the next one in order is ready. When `stats` is given it is
+    updated after each result with the count, elapsed seconds and
+    throughput per second.
+    """
+    executor, workers = _executor(use_processes, workers)
+    pending = deque()
+    count = 0
+    start = time.monotonic()
+    with executor:
+        for item in items:
+            pending.append(executor.submit(func, *item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+                count += 1
+                _update_stats(stats, count, start)
+        while pending:
+            yield pending.popleft().result()
+            count += 1
+            _update_stats(stats, count, start)
+
+
+def _update_stats(stats: dict, count: int, start: float) -> None:
+    """Records the throughput of a batch operation"""
+    if stats is None:
+        return
+    elapsed = time.monotonic() - start
+    stats['count'] = count
+    stats['seconds'] = elapsed
+    stats['per_second'] = count / elapsed if elapsed else 0.0
+
+
+def hash_passwords(passwords: Iterable[str], use_processes: bool = False,
+                   workers: int = None,
+                   stats: dict = None) -> Iterator[bytes]:
+    """
+    Hashes many passwords in parallel.
+
+    bcrypt releases the GIL while hashing, so the default thread pool
+    already uses every core; `use_processes` switches to a process pool.
+    The cost is resolved once, here, and passed to every worker: worker
+    processes do not see the cost configured in this one.
+
+    Args:
+      passwords (Iterable[str]): The passwords to hash.
+      use_processes (bool): Use a process pool instead of threads.
+      workers (int): The pool size. Defaults to the number of cores.
+      stats (dict): Filled with `count`, `seconds` and `per_second`.
+
+    Returns:
+      Iterator[bytes]: The hashed passwords, in input order.
+    """
+    cost = get_cost()
+    return _ordered_map(hash_password, ((pwd, cost) for pwd in passwords),
+                        use_processes, workers, stats)
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                use_processes: bool = False, workers: int = None,
+                stats: dict = None) -> Iterator[bool]:
+    """
+    Checks many (hashed_password, password) pairs in parallel.
+
+    Args:
+      pairs (Iterable[Tuple[bytes, str]]): The pairs to check.
+      use_processes (bool): Use a process pool instead of threads.
+      workers (int): The pool size. Defaults to the number of cores.
+      stats (dict): Filled with `count`, `seconds` and `per_second`.
+
+    Returns:
+      Iterator[bool]: Whether each password matches, in input order.
+    """
+    return _ordered_map(is_valid, pairs, use_processes, workers, stats)
@@ -16,49 +16,333 @@ Author: Okeomasilachi
 
 
 import re
+import sys
+import json
+import time
+import queue
 import logging
-from typing import List
+import threading
+from functools import lru_cache
+from typing import (Callable, Iterator, List, Mapping, Optional, Pattern,
+                    Sequence, Tuple, Union)
 import os
 import mysql.connector
 from mysql.connector.connection import MySQLConnection
+from connection_pool import ConnectionPool, PooledConnection
+
+
+@lru_cache(maxsize=128)
+def _redaction_pattern(fields: Tuple[str, ...], separator: str) -> Pattern:
+    """
+    Compiles a single alternation pattern matching any of the given
+    fields followed by its value up to the separator.
+
+    The result is cached per (fields, separator) pair, so every log
+    record after the first one reuses the same compiled pattern.
+    """
+    return re.compile(
+        "(?P<field>{})=[^{}]*".format("|".join(fields), separator))
 
 
 def filter_datum(fields: List[str], redaction: str, message: str,
                  separator: str) -> str:
     """Returns the log message obfuscated"""
-    for field in fields:
-        message = re.sub(f"{field}=[^{separator}]*",
-                         f"{field}={redaction}", message)
-    return message
+    if not fields:
+        return message
+    pattern = _redaction_pattern(tuple(fields), separator)
+    return pattern.sub("\\g<field>={}".format(redaction), message)
 
 
 PII_FIELDS = ('name', 'email', 'phone', 'password', 'ssn')
 
 
+class RedactedMessage(str):
+    """
+    A log message that is redacted already.
+
+    `RedactingFormatter` does not scan such messages again, so only
+    build them from values that went through a redaction step, as
+    `row_formatter` does.
+    """
+
+
 class RedactingFormatter(logging.Formatter):
     """
     Redacting Formatter class
+
+    Records whose message is a mapping (see `log_fields`) are redacted
+    by key, without any regex: the values of PII keys are replaced by
+    the redaction marker before the message is built. With the "kv"
+    layout the message is rendered as `key=value; key=value;`, with the
+    "json" layout every record is emitted as a JSON line.
     """
 
     REDACTION = "***"
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
+    LAYOUTS = ("kv", "json")
 
-    def __init__(self, fields: List[str] = None):
+    def __init__(self, fields: List[str] = None, layout: str = "kv"):
         super(RedactingFormatter, self).__init__(self.FORMAT)
+        if layout not in self.LAYOUTS:
+            raise ValueError("Unknown layout: {}".format(layout))
         self.fields = fields if fields else []
+        self.layout = layout
+
+    def redact_fields(self, fields: Mapping) -> dict:
+        """Returns a copy of the mapping with its PII values redacted"""
+        pii = self.fields
+        return {key: self.REDACTION if key in pii else value
+                for key, value in fields.items()}
 
     def format(self, record: List[str]) -> str:
         """Formats the log record and applies data filtering"""
+        if isinstance(record.msg, Mapping):
+            fields = self.redact_fields(record.msg)
+            if self.layout == "json":
+                return self._format_json(record, fields)
+            message = "{} ".format(self.SEPARATOR).join(
+                "{}={}".format(key, value) for key, value in fields.items())
+            if message:
+                message += self.SEPARATOR
+            return self._format_redacted(record, message)
+        if isinstance(record.msg, RedactedMessage):
+            if self.layout == "json":
+                return self._format_json(record, record.getMessage())
+            return self._format_redacted(record, record.getMessage())
+        if self.layout == "json":
+            return self._format_json(record, filter_datum(
+                self.fields, self.REDACTION, record.getMessage(),
+                self.SEPARATOR))
         return filter_datum(self.fields, self.REDACTION,
                             super().format(record), self.SEPARATOR)
 
+    def formatException(self, ei) -> str:
+        """Formats an exception traceback and applies data filtering"""
+        return filter_datum(self.fields, self.REDACTION,
+                            super().formatException(ei), self.SEPARATOR)
+
+    def formatStack(self, stack_info: str) -> str:
+        """Formats a stack trace and applies data filtering"""
+        return filter_datum(self.fields, self.REDACTION,
+                            super().formatStack(stack_info), self.SEPARATOR)
+
+    def _format_redacted(self, record: logging.LogRecord,
+                         message: str) -> str:
+        """
+        Formats a record with an already redacted message.
+
+        Only the traceback is filtered: the exception text cached on
+        the record by another formatter is ignored, so it always goes
+        through `formatException`.
+        """
+        saved = record.msg, record.args, record.exc_text
+        record.msg, record.args, record.exc_text = message, None, None
+        try:
+            return super().format(record)
+        finally:
+            record.msg, record.args, record.exc_text = saved
+
+    def _format_json(self, record: logging.LogRecord, message) -> str:
+        """Renders an already redacted message as a JSON line"""
+        line = {
+            "name": record.name,
+            "level": record.levelname,
+            "asctime": self.formatTime(record),
+            "message": message,
+        }
+        if record.exc_info:
+            line["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+
+def row_formatter(columns: Sequence[str], fields: Sequence[str] = PII_FIELDS,
+                  redaction: str = RedactingFormatter.REDACTION,
+                  separator: str = RedactingFormatter.SEPARATOR
+                  ) -> Callable[[Sequence], RedactedMessage]:
+    """
+    Compiles, once per query, a function rendering a database row as a
+    redacted `name=***; ip=...;` log message.
+
+    The PII columns are resolved by position when the function is
+    built: their marker is baked into the line template and their
+    values are never read, so each row is rendered with a single
+    `str.format` call and no regex.
+
+    Args:
+      columns (Sequence[str]): The column names of the result set.
+      fields (Sequence[str]): The PII columns to redact.
+      redaction (str): The marker replacing PII values.
+      separator (str): The separator ending each `key=value` pair.
+
+    Returns:
+      Callable: A function taking a row and returning its message.
+    """
+    pii = set(fields)
+    parts = []
+    keep = []
+    for index, column in enumerate(columns):
+        if column in pii:
+            value = redaction.replace("{", "{{").replace("}", "}}")
+        else:
+            value = "{}"
+            keep.append(index)
+        parts.append("{}={}{}".format(
+            column.replace("{", "{{").replace("}", "}}"), value, separator))
+    template = " ".join(parts)
+
+    def format_row(row: Sequence) -> RedactedMessage:
+        """Renders a row with its PII columns redacted"""
+        return RedactedMessage(template.format(*[row[i] for i in keep]))
+    return format_row
+
+
+def log_fields(logger: logging.Logger, level: int, **fields) -> None:
+    """
+    Logs keyword fields as a structured record, which
+    `RedactingFormatter` redacts by key instead of by regex.
+    """
+    logger.log(level, fields)
+
+
+class AsyncRedactingHandler(logging.Handler):
+    """
+    Handler that moves redaction and stream I/O off the calling thread.
+
+    Records are put on a bounded queue and a background listener thread
+    formats them and writes them to the stream in batches. When the
+    queue is full, the overflow policy decides what happens:
+
+      - "block": the caller waits for room in the queue.
+      - "drop-oldest": the oldest queued record is discarded.
+      - "sample": only one overflowing record out of `sample_rate` is
+        kept (replacing the oldest queued record), the rest are dropped.
+
+    `flush()` waits until every queued record has been written, and
+    `close()` drains the queue and stops the listener. Both are called
+    by `logging.shutdown` when the interpreter exits.
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop-oldest", "sample")
+
+    def __init__(self, stream=None, maxsize: int = 10000,
+                 batch_size: int = 100, overflow: str = "block",
+                 sample_rate: int = 10):
+        super().__init__()
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: {}".format(overflow))
+        if maxsize < 1 or batch_size < 1 or sample_rate < 1:
+            raise ValueError("maxsize, batch_size and sample_rate "
+                             "must be positive integers")
+        self.stream = stream if stream is not None else sys.stderr
+        self.queue = queue.Queue(maxsize)
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._overflowed = 0
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._listen, name="AsyncRedactingHandler", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Puts the record on the queue according to the overflow policy"""
+        if self._closed:
+            return
+        if record.args:
+            # Merge the arguments now, they may be mutated by the caller
+            # before the listener formats the record.
+            record.msg = record.getMessage()
+            record.args = None
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == "sample":
+            self._overflowed += 1
+            if self._overflowed % self.sample_rate != 0:
+                self.dropped += 1
+                return
+        self._put_dropping_oldest(record)
 
-def get_logger() -> logging.Logger:
+    def _put_dropping_oldest(self, record: logging.LogRecord) -> None:
+        """Discards queued records until the new record fits"""
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                continue
+
+    def _listen(self) -> None:
+        """Formats and writes queued records in batches until closed"""
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            lines = []
+            for record in batch:
+                if record is None:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.format(record) + "\n")
+                except Exception:
+                    self.handleError(record)
+            try:
+                if lines:
+                    self.stream.write("".join(lines))
+                    self.stream.flush()
+            except Exception:
+                self.handleError(batch[-1])
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def flush(self) -> None:
+        """Waits until every queued record has been written"""
+        if self._thread.is_alive():
+            self.queue.join()
+
+    def close(self) -> None:
+        """Writes the remaining records and stops the listener"""
+        if not self._closed:
+            self._closed = True
+            if self._thread.is_alive():
+                self.queue.put(None)
+                self._thread.join()
+        super().close()
+
+
+def get_logger(asynchronous: bool = None) -> logging.Logger:
     """
     Returns a logger object configured to log user
     data with redacted PII fields.
 
+    Args:
+      asynchronous (bool): Use an `AsyncRedactingHandler` instead of a
+        plain `StreamHandler`. Defaults to the PERSONAL_DATA_ASYNC_LOG
+        environment variable. The queue is configured with
+        PERSONAL_DATA_LOG_QUEUE_SIZE, PERSONAL_DATA_LOG_BATCH_SIZE and
+        PERSONAL_DATA_LOG_OVERFLOW.
+
     Returns:
       logger (logging.Logger): The configured logger object.
     """
@@ -67,7 +351,17 @@ def get_logger() -> logging.Logger:
 
     formatter = RedactingFormatter(PII_FIELDS)
 
-    handler = logging.StreamHandler()
+    if asynchronous is None:
+        asynchronous = os.getenv(
+            "PERSONAL_DATA_ASYNC_LOG", "").lower() in ("1", "true")
+    if asynchronous:
+        handler = AsyncRedactingHandler(
+            maxsize=int(os.getenv("PERSONAL_DATA_LOG_QUEUE_SIZE", 10000)),
+            batch_size=int(os.getenv("PERSONAL_DATA_LOG_BATCH_SIZE", 100)),
+            overflow=os.getenv("PERSONAL_DATA_LOG_OVERFLOW", "block")
+        )
+    else:
+        handler = logging.StreamHandler()
     handler.setFormatter(formatter)
 
     logger.addHandler(handler)
@@ -76,11 +370,52 @@ def get_logger() -> logging.Logger:
     return logger
 
 
-def get_db() -> MySQLConnection:
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _connect() -> MySQLConnection:
+    """Opens a new connection from the environment credentials"""
+    return mysql.connector.connect(
+        user=os.getenv("PERSONAL_DATA_DB_USERNAME", "root"),
+        password=os.getenv("PERSONAL_DATA_DB_PASSWORD", ""),
+        host=os.getenv("PERSONAL_DATA_DB_HOST", "localhost"),
+        database=os.getenv("PERSONAL_DATA_DB_NAME", "my_db")
+    )
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process wide connection pool, creating it on first use.
+
+    The pool is sized by PERSONAL_DATA_DB_POOL_SIZE and idle
+    connections older than PERSONAL_DATA_DB_POOL_RECYCLE seconds are
+    replaced on checkout.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                _connect,
+                size=int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", 5)),
+                recycle=float(
+                    os.getenv("PERSONAL_DATA_DB_POOL_RECYCLE", 300))
+            )
+        return _pool
+
+
+def get_db() -> Union[MySQLConnection, PooledConnection]:
     """
     Retrieve database credentials from
     environment variables
+
+    When PERSONAL_DATA_DB_POOL_SIZE is set, the connection is checked
+    out of the shared pool (see `get_pool`) and calling `close()` on it
+    returns it to the pool. Connection errors are raised in that mode.
     """
+    if os.getenv("PERSONAL_DATA_DB_POOL_SIZE"):
+        return get_pool().connection()
+
     username = os.getenv("PERSONAL_DATA_DB_USERNAME", "root")
     password = os.getenv("PERSONAL_DATA_DB_PASSWORD", "")
     host = os.getenv("PERSONAL_DATA_DB_HOST", "localhost")
@@ -98,21 +433,148 @@ def get_db() -> MySQLConnection:
         print("Error:", err)
 
 
+def stream_users(db: MySQLConnection, batch_size: int = 1000,
+                 key_column: str = None,
+                 start_after: str = None
+                 ) -> Iterator[Tuple[Tuple[str, ...], List[tuple]]]:
+    """
+    Streams the users table in batches through an unbuffered cursor.
+
+    Rows are pulled from the server `batch_size` at a time, so memory
+    stays constant whatever the size of the table and the first batch
+    is available as soon as the server starts sending rows.
+
+    Args:
+      db (MySQLConnection): An open database connection.
+      batch_size (int): The number of rows fetched per batch.
+      key_column (str): A unique column used to order the rows so an
+        interrupted export can be resumed. Rows are not ordered when
+        it is None.
+      start_after (str): Only rows whose key is greater than this
+        value are returned. Requires `key_column`.
+
+    Yields:
+      tuple: The column names of the result and the next batch of rows.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+    query = "SELECT * FROM users"
+    params = ()
+    if key_column is not None:
+        if not re.fullmatch(r"\w+", key_column):
+            raise ValueError("Invalid key column: {}".format(key_column))
+        if start_after is not None:
+            query += " WHERE `{}` > %s".format(key_column)
+            params = (start_after,)
+        query += " ORDER BY `{}`".format(key_column)
+    elif start_after is not None:
+        raise ValueError("start_after requires a key_column")
+
+    cursor = db.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield tuple(cursor.column_names), rows
+    finally:
+        cursor.close()
+
+
+def _read_checkpoint(file_path: str) -> Optional[str]:
+    """Returns the last exported key stored in a checkpoint file"""
+    if not file_path or not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r') as f:
+        key = f.read().strip()
+    return key if key else None
+
+
+def _write_checkpoint(file_path: str, key) -> None:
+    """
+    Atomically stores the last exported key in a checkpoint file.
+
+    The key is written in plain text: it must not come from a PII
+    column, which `export_users` enforces.
+    """
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(key))
+    os.replace(tmp_path, file_path)
+
+
+def export_users(logger: logging.Logger, db: MySQLConnection,
+                 batch_size: int = 1000, key_column: str = None,
+                 checkpoint: str = None) -> int:
+    """
+    Logs every row of the users table in streaming mode.
+
+    Progress (rows and rows/sec) is reported on stderr after each
+    batch. When a checkpoint file is given, the key of the last logged
+    row is saved to it in plain text after each batch, and an existing
+    checkpoint is used to resume the export right after that key. The
+    key column must therefore not be one of the PII_FIELDS (e.g. use
+    an `id` column rather than `email`).
+
+    Returns:
+      int: The number of rows logged.
+    """
+    if checkpoint is not None and key_column is None:
+        raise ValueError("A checkpoint requires a key_column")
+    if checkpoint is not None and key_column in PII_FIELDS:
+        raise ValueError("The checkpoint key column cannot be a PII "
+                         "field: {}".format(key_column))
+    start_after = _read_checkpoint(checkpoint)
+    format_row = None
+    key_index = None
+    count = 0
+    start = time.monotonic()
+    for columns, rows in stream_users(db, batch_size, key_column,
+                                      start_after):
+        if format_row is None:
+            format_row = row_formatter(columns)
+            if key_column is not None:
+                key_index = columns.index(key_column)
+        for row in rows:
+            logger.info(format_row(row))
+        count += len(rows)
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, rows[-1][key_index])
+        elapsed = time.monotonic() - start
+        print("[progress] rows={} rows/sec={:.1f}".format(
+            count, count / elapsed if elapsed else 0.0), file=sys.stderr)
+    return count
+
+
 def main() -> None:
     """
     Entry point of the program.
 
     Retrieves user data from the database and logs it using the logger.
+
+    Setting PERSONAL_DATA_STREAM=1 switches to the streaming export
+    (see `export_users`), configured with PERSONAL_DATA_BATCH_SIZE,
+    PERSONAL_DATA_KEY_COLUMN and PERSONAL_DATA_CHECKPOINT.
     """
     logger = get_logger()
     db = get_db()
+    if os.getenv("PERSONAL_DATA_STREAM", "").lower() in ("1", "true"):
+        try:
+            export_users(
+                logger, db,
+                batch_size=int(os.getenv("PERSONAL_DATA_BATCH_SIZE", 1000)),
+                key_column=os.getenv("PERSONAL_DATA_KEY_COLUMN"),
+                checkpoint=os.getenv("PERSONAL_DATA_CHECKPOINT")
+            )
+        finally:
+            db.close()
+        return
     cursor = db.cursor()
     cursor.execute("SELECT * FROM users;")
-    param = "name={}; email={}; phone={}; ssn={}; " + \
-        "password={}; ip={}; last_login={}; user_agent={};"
+    format_row = row_formatter(cursor.column_names)
     for row in cursor.fetchall():
-        logger.info(
-            param.format(*row))
+        logger.info(format_row(row))
     cursor.close()
     db.close()
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+This module re-redacts existing log files in parallel.
+
+The input file is memory-mapped and split into line-aligned chunks,
+which worker processes redact line by line with `filter_datum`, the
+same way `RedactingFormatter` redacts each record. The chunks are
+written to the output in their original order, and only a few chunks
+per worker are in flight at once, so memory stays bounded whatever the
+size of the file.
+
+Usage: ./redact_logs.py input.log output.log [--fields name,email,...]
+
+Author: Okeomasilachi
+"""
+
+
+import os
+import sys
+import mmap
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from typing import Iterator, List, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+
+_mm = None
+_fields = None
+
+
+def chunk_bounds(mm: mmap.mmap, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Splits a mapped file into chunks of about `chunk_size` bytes, each
+    ending right after a newline (or at the end of the file).
+    """
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = mm.find(b"\n", min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+
+def _init_worker(file_path: str, fields: List[str]) -> None:
+    """Maps the input file once per worker process"""
+    global _mm, _fields
+    with open(file_path, 'rb') as f:
+        _mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _fields = fields
+
+
+def redact_chunk(bounds: Tuple[int, int]) -> bytes:
+    """Redacts every line of a chunk of the mapped file"""
+    start, end = bounds
+    text = _mm[start:end].decode('utf-8', 'surrogateescape')
+    lines = text.split("\n")
+    redacted = [filter_datum(_fields, RedactingFormatter.REDACTION, line,
+                             RedactingFormatter.SEPARATOR)
+                for line in lines]
+    return "\n".join(redacted).encode('utf-8', 'surrogateescape')
+
+
+def redact_file(input_path: str, output_path: str,
+                fields: List[str] = PII_FIELDS, workers: int = None,
+                chunk_size: int = 4 * 1024 * 1024) -> int:
+    """
+    Redacts a log file into another one using a pool of processes.
+
+    Returns:
+      int: The number of bytes read.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    workers = workers or os.cpu_count() or 1
+    fields = list(fields)
+    with open(input_path, 'rb') as f, open(output_path, 'wb') as out:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            with multiprocessing.Pool(workers, _init_worker,
+                                      (input_path, fields)) as pool:
+                pending = deque()
+                for bounds in chunk_bounds(mm, chunk_size):
+                    pending.append(pool.apply_async(redact_chunk, (bounds,)))
+                    if len(pending) >= workers * 2:
+                        out.write(pending.popleft().get())
+                while pending:
+                    out.write(pending.popleft().get())
+    return size
+
+
+def main() -> None:
+    """Parses the command line and redacts the file"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--fields", default=",".join(PII_FIELDS),
+                        help="comma-separated fields to redact")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes, defaults to the core count")
+    parser.add_argument("--chunk-size", type=int, default=4,
+                        help="chunk size in MiB")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    size = redact_file(args.input, args.output,
+                       [field for field in args.fields.split(",") if field],
+                       args.workers, args.chunk_size * 1024 * 1024)
+    elapsed = time.monotonic() - start
+    print("Redacted {} bytes in {:.2f}s ({:.1f} MiB/s)".format(
+        size, elapsed, size / elapsed / 1024 / 1024 if elapsed else 0.0),
+        file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
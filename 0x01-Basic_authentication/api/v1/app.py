@@ -13,6 +13,12 @@ app = Flask(__name__)
 app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
+# paths served without authentication, see Auth.require_auth
+EXCLUDED_PATHS = [
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/'
+]
 
 
 if os.environ.get('AUTH_TYPE') == 'auth':
@@ -39,14 +45,7 @@ def handle_before_request():
     if auth is None:
         return
 
-    if not auth.require_auth(
-        request.path,
-        [
-            '/api/v1/status/',
-            '/api/v1/unauthorized/',
-            '/api/v1/forbidden/'
-        ]
-    ):
+    if not auth.require_auth(request.path, EXCLUDED_PATHS):
         return
 
     if auth.authorization_header(request) is None:
@@ -2,18 +2,64 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import (abort, current_app, jsonify, request, Response,
+                   stream_with_context, url_for)
 from models.user import User
 
 
+# Number of users fetched at once while streaming the list of users
+STREAM_BATCH = 1000
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of users to return
+      - cursor: id of the last user of the previous page
     Return:
-      - list of all User objects JSON represented
+      - list of User objects JSON represented, in id order. Without
+        `limit`, all users, streamed. With `limit`, one page, and a
+        `Link: <...>; rel="next"` header to the next page if any
+      - 400 if limit is not a positive integer
+    """
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit')
+    if limit is None:
+        return Response(stream_with_context(stream_users(cursor)),
+                        mimetype='application/json')
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit <= 0:
+        return jsonify({'error': "limit must be a positive integer"}), 400
+    users = User.page(limit, cursor)
+    response = jsonify([user.to_json() for user in users])
+    if len(users) == limit:
+        response.headers['Link'] = '<{}>; rel="next"'.format(url_for(
+            'app_views.view_all_users', limit=limit, cursor=users[-1].id,
+            _external=True))
+    return response
+
+
+def stream_users(cursor: str = None):
+    """ Generate the JSON array of the users following a cursor, one
+    batch of users at a time, encoded as jsonify does
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    provider = current_app.json
+    if provider.compact or (provider.compact is None
+                            and not current_app.debug):
+        options = {'separators': (",", ":")}
+    else:
+        options = {'indent': 2}
+    separator = "["
+    for users in User.pages(STREAM_BATCH, cursor):
+        # the batch as a JSON array, without its brackets
+        yield separator + provider.dumps([user.to_json() for user in users],
+                                         **options)[1:-1]
+        separator = ","
+    yield "[]\n" if separator == "[" else "]\n"
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -1,40 +1,298 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_right
+from contextlib import contextmanager
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+import heapq
+from typing import Callable, TypeVar, List, Iterable, Iterator, Tuple
+from os import getenv, path, stat
+import sys
+import threading
 import uuid
+from models.journal import Journal, journal_path, OP_SAVE, OP_REMOVE
+from models.index import HashIndex, SortedIndex
+from models.lazy import LazyStore
+from models.compact import TimestampField, compact_attributes
+from models.serializers import BinarySerializer, JSONSerializer
+from models.flusher import Flusher
+from models.locking import ClassLock
+from models.query import Plan
+from models.snapshot import load_snapshot, write_snapshot
+from models.sqlite_store import SQLiteStore
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
 
+# Journaled storage: each save/remove appends to `.db_<Class>.journal`
+# instead of rewriting `.db_<Class>.json`, which is only rewritten
+# (compacted) once the journal holds JOURNAL_THRESHOLD writes.
+JOURNAL = getenv('DB_JOURNAL', '').lower() in ('1', 'true')
+JOURNAL_THRESHOLD = int(getenv('DB_JOURNAL_THRESHOLD', 1000))
+JOURNALS = {}
+
+# Background snapshots: a background thread compacts the journal every
+# SNAPSHOT_INTERVAL seconds when it holds writes, or as soon as it
+# holds JOURNAL_THRESHOLD of them, instead of the write reaching the
+# threshold. Implies journal mode.
+SNAPSHOT_INTERVAL = float(getenv('DB_SNAPSHOT_INTERVAL', 0))
+JOURNAL = JOURNAL or SNAPSHOT_INTERVAL > 0
+SNAPSHOTTER = None
+
+# Multi-process mode: processes sharing the files of the store (e.g.
+# WSGI workers) journal their writes under an exclusive file lock,
+# `.db_<Class>.lock`. Before reading, a process applies the writes the
+# others journaled since its last sync; changes are detected from the
+# stat of the snapshot and the size of the journal, and a rewritten
+# snapshot is reloaded. Implies journal mode and disables write-behind.
+MULTIPROCESS = getenv('DB_MULTIPROCESS', '').lower() in ('1', 'true')
+JOURNAL = JOURNAL or MULTIPROCESS
+# (snapshot stat, journal offset) of each class as of its last sync
+SYNC = {}
+
+# Secondary indexes of each class, built from the INDEXES declaration
+# of the class on first use
+SECONDARY_INDEXES = {}
+# Sorted indexes on the timestamps, for classes running range queries
+# on them: INDEXES = dict(TIMESTAMP_INDEXES, ...). Every save moves the
+# object in the updated_at index, so they are not declared by default.
+TIMESTAMP_INDEXES = {'created_at': {'sorted': True},
+                     'updated_at': {'sorted': True}}
+
+# Lazy loading: load_from_file only keeps the raw records, objects are
+# built on first access. At most CACHE_SIZE objects per class stay
+# built (0 for no limit).
+LAZY = getenv('DB_LAZY', '').lower() in ('1', 'true')
+CACHE_SIZE = int(getenv('DB_CACHE_SIZE', 0))
+TIMESTAMP_ATTRIBUTES = ('created_at', 'updated_at')
+
+# Compact objects: model classes use __slots__ instead of a __dict__,
+# timestamps are stored as integer seconds and the string values of
+# the INTERNED attributes of a class are interned. Decided at import.
+COMPACT = getenv('DB_COMPACT', '').lower() in ('1', 'true')
+COMPACT_ALIASES = {'_created_ts': 'created_at', '_updated_ts': 'updated_at'}
+
+# Attribute holding the to_json results of an object, by view
+# (for_serialization or not), created by to_json and dropped by every
+# attribute write
+JSON_CACHE = '_json_cache'
+
+# Write-behind: save/remove only queue the write, a background thread
+# persists the queued writes every FLUSH_INTERVAL seconds (the
+# durability window) or once FLUSH_THRESHOLD writes are pending.
+WRITE_BEHIND = (getenv('DB_WRITE_BEHIND', '').lower() in ('1', 'true')
+                and not MULTIPROCESS)
+FLUSH_INTERVAL = float(getenv('DB_FLUSH_INTERVAL', 1.0))
+FLUSH_THRESHOLD = int(getenv('DB_FLUSH_THRESHOLD', 100))
+FLUSHER = None
+
+# File formats of the store, `Base.serializer` defaults to DB_FORMAT
+SERIALIZERS = {
+    'json': JSONSerializer(TIMESTAMP_FORMAT),
+    'binary': BinarySerializer(TIMESTAMP_FORMAT, TIMESTAMP_ATTRIBUTES),
+}
+
+# Storage backend: with 'file', objects are held in DATA and persisted
+# to the files above; with 'sqlite', they are only kept in the SQLite
+# database DB_SQLITE_PATH and built when read, see models.sqlite_store
+STORAGE = getenv('DB_STORAGE', 'file')
+BACKEND = None
+if STORAGE == 'sqlite':
+    BACKEND = SQLiteStore(getenv('DB_SQLITE_PATH', '.db.sqlite3'))
+
+# Locks of each class: readers (get, count, search) share the store,
+# writers (save, remove, load) hold it alone and journaling is
+# serialized, see models.locking.ClassLock
+LOCKS = {}
+_LOCKS_LOCK = threading.Lock()
+
+
+def storage_exists(s_class: str) -> bool:
+    """ Whether anything was stored for a class: objects in memory,
+    writes queued in write-behind mode, a file or a journal
+    """
+    if BACKEND is not None:
+        return BACKEND.exists(s_class)
+    if DATA.get(s_class):
+        return True
+    if FLUSHER is not None and FLUSHER.pending(s_class):
+        return True
+    if path.exists(".db_{}.{}".format(s_class, Base.serializer.extension)):
+        return True
+    return JOURNAL and path.exists(journal_path(s_class))
+
+
+def _lock(s_class: str) -> ClassLock:
+    """ Return the locks of a class
+    """
+    lock = LOCKS.get(s_class)
+    if lock is None:
+        with _LOCKS_LOCK:
+            if s_class not in LOCKS:
+                LOCKS[s_class] = ClassLock(
+                    ".db_{}.lock".format(s_class) if MULTIPROCESS else None)
+            lock = LOCKS[s_class]
+    return lock
+
+
+def _snapshotter() -> Flusher:
+    """ Return the thread of the background snapshots
+    """
+    global SNAPSHOTTER
+    if SNAPSHOTTER is None:
+        with _LOCKS_LOCK:
+            if SNAPSHOTTER is None:
+                SNAPSHOTTER = Flusher(lambda cls, ops: cls.save_to_file(),
+                                      SNAPSHOT_INTERVAL, JOURNAL_THRESHOLD,
+                                      name="model-snapshotter")
+    return SNAPSHOTTER
+
+
+def _file_key(file_path: str):
+    """ Stat of a file telling its rewrites apart, None if missing
+    """
+    try:
+        st = stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _file_size(file_path: str) -> int:
+    """ Size of a file, 0 if missing
+    """
+    try:
+        return stat(file_path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _new_store(cls: type):
+    """ Return an empty object store for a class
+    """
+    if LAZY:
+        return LazyStore(cls, CACHE_SIZE, TIMESTAMP_ATTRIBUTES)
+    return {}
+
+
+def _stored(s_class: str, obj_id: str):
+    """ Return the stored object of an id, or its raw record when it
+    has not been built yet
+    """
+    store = DATA.get(s_class)
+    if store is None:
+        return None
+    if isinstance(store, LazyStore):
+        return store.peek(obj_id)
+    return store.get(obj_id)
+
+
+def _records(s_class: str):
+    """ Iterate over the (id, object or raw record) of a class
+    """
+    store = DATA.get(s_class, {})
+    if isinstance(store, LazyStore):
+        return store.records()
+    return list(store.items())
+
+
+def _value(entry, attr: str):
+    """ Value of an attribute of an object or of a raw record
+    """
+    if isinstance(entry, dict):
+        return entry.get(attr)
+    return getattr(entry, attr, None)
+
 
 class Base():
     """ Base class
+
+    Subclasses declare secondary indexes in INDEXES, mapping an
+    attribute name to the options of its index, e.g.:
+        INDEXES = dict(Base.INDEXES, email={'unique': True})
+    With 'sorted', the index also serves prefix and range queries, see
+    TIMESTAMP_INDEXES for the timestamps.
+    Indexes are kept in sync on save, remove and attribute writes, and
+    `search` uses them as planned by `explain`.
+
+    In compact mode, subclasses must declare their attributes in
+    __slots__, and may list attributes with often repeated string
+    values in INTERNED.
     """
 
+    INDEXES = {}
+    INTERNED = ()
+    serializer = SERIALIZERS[getenv('DB_FORMAT', 'json')]
+    if COMPACT:
+        __slots__ = ('id', '_created_ts', '_updated_ts', JSON_CACHE)
+        created_at = TimestampField('_created_ts')
+        updated_at = TimestampField('_updated_ts')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA.setdefault(s_class, _new_store(self.__class__))
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
+        if isinstance(kwargs.get('created_at'), datetime):
+            self.created_at = kwargs.get('created_at')
+        elif kwargs.get('created_at') is not None:
             self.created_at = datetime.strptime(kwargs.get('created_at'),
                                                 TIMESTAMP_FORMAT)
         else:
             self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
+        if isinstance(kwargs.get('updated_at'), datetime):
+            self.updated_at = kwargs.get('updated_at')
+        elif kwargs.get('updated_at') is not None:
             self.updated_at = datetime.strptime(kwargs.get('updated_at'),
                                                 TIMESTAMP_FORMAT)
         else:
             self.updated_at = datetime.utcnow()
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, updating the index of a stored object
+
+        Raises a ValueError when the attribute has a unique index which
+        already holds the new value for another object.
+        """
+        if name in self.INDEXES and self._is_stored():
+            with _lock(self.__class__.__name__).rw.write():
+                index = self.__class__._indexes()[name]
+                if (value != getattr(self, name, None)
+                        and index.conflicts(self.id, value)):
+                    raise ValueError("{} already exists".format(name))
+                self._assign(name, value, index)
+        else:
+            self._assign(name, value)
+
+    def _assign(self, name: str, value, index: HashIndex = None):
+        """ Set an attribute, moving the object in `index` when given,
+        and drop the cached to_json results
+        """
+        if COMPACT and type(value) is str and name in self.INTERNED:
+            value = sys.intern(value)
+        if index is None:
+            super().__setattr__(name, value)
+        else:
+            index.discard(self.id, getattr(self, name, None))
+            super().__setattr__(name, value)
+            index.add(self.id, value)
+        # dropped rather than cleared, once the value is set: a to_json
+        # running concurrently stores its result in the cache it
+        # started from. Objects never converted get no cache at all.
+        if getattr(self, JSON_CACHE, None) is not None:
+            super().__setattr__(JSON_CACHE, None)
+
+    def _is_stored(self) -> bool:
+        """ Whether this instance is the one held in DATA
+        """
+        s_class = self.__class__.__name__
+        obj_id = getattr(self, 'id', None)
+        return _stored(s_class, obj_id) is self
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -46,67 +304,449 @@ class Base():
 
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
+
+        The result is cached until an attribute is set, each call
+        returns a copy of it. Values changed in place (e.g. a list
+        attribute appended to) are not seen until then.
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
-        return result
+        cache = getattr(self, JSON_CACHE, None)
+        if cache is None:
+            cache = {}
+            super().__setattr__(JSON_CACHE, cache)
+        result = cache.get(for_serialization)
+        if result is None:
+            result = {}
+            for key, value in self._serializable().items():
+                if not for_serialization and key[0] == '_':
+                    continue
+                if type(value) is datetime:
+                    result[key] = value.strftime(TIMESTAMP_FORMAT)
+                else:
+                    result[key] = value
+            cache[for_serialization] = result
+        return dict(result)
+
+    def _serializable(self) -> dict:
+        """ Attributes to persist, timestamps left to the serializer
+        """
+        if COMPACT:
+            attributes = dict(compact_attributes(self, COMPACT_ALIASES))
+        else:
+            attributes = dict(self.__dict__)
+        attributes.pop(JSON_CACHE, None)
+        return attributes
+
+    @classmethod
+    def _file_path(cls) -> str:
+        """ Path of the file of the class, in the format of its serializer
+        """
+        return ".db_{}.{}".format(cls.__name__, cls.serializer.extension)
 
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+
+        In journal mode, the journaled writes are replayed on top of
+        the objects of the file. In lazy mode, only the raw records are
+        kept and objects are built on first access. Backends other than
+        files need no loading.
         """
+        if BACKEND is not None:
+            return
+        lock = _lock(cls.__name__)
+        with lock.persist:
+            if lock.file is None:
+                cls._load()
+            else:
+                with lock.file.shared():
+                    cls._load()
+
+    @classmethod
+    def file_records(cls) -> dict:
+        """ Return the records of the objects kept in the files of the
+        class, journaled writes included, e.g. to move them to another
+        backend
+        """
+        records, _ = cls._read_files(Journal(journal_path(cls.__name__)))
+        return records
+
+    @classmethod
+    def _read_files(cls, journal: Journal = None) -> Tuple[dict, int]:
+        """ Return the records of the snapshot of the class with the
+        writes of `journal` applied, and the journal offset read up to
+        """
+        records = load_snapshot(cls._file_path(), cls.serializer) or {}
+        offset = 0
+        if journal is not None:
+            # the handle of a journal rotated by another process is stale
+            journal.close()
+            writes, offset = journal.read()
+            for op, obj_id, obj_json in journal.read_rotated() + writes:
+                if op == OP_SAVE:
+                    records[obj_id] = obj_json
+                elif op == OP_REMOVE:
+                    records.pop(obj_id, None)
+        return records, offset
+
+    @classmethod
+    def _load(cls):
+        """ Build the store of the class from file, then swap it in
+        """
+        s_class = cls.__name__
+        snapshot = _file_key(cls._file_path())
+        store = _new_store(cls)
+        objs_json, offset = cls._read_files(cls._journal() if JOURNAL
+                                            else None)
+        for obj_id, obj_json in objs_json.items():
+            if LAZY:
+                store.load(obj_id, obj_json)
+            else:
+                store[obj_id] = cls(**obj_json)
+        with _lock(s_class).rw.write():
+            DATA[s_class] = store
+            SECONDARY_INDEXES.pop(s_class, None)
+        if MULTIPROCESS:
+            SYNC[s_class] = (snapshot, offset)
+
+    @classmethod
+    def _sync(cls):
+        """ In multi-process mode, catch up with the writes of the other
+        processes when the files of the class changed since the last sync
+        """
+        if not MULTIPROCESS:
+            return
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        if SYNC.get(s_class) == (_file_key(cls._file_path()),
+                                 _file_size(journal_path(s_class))):
             return
+        lock = _lock(s_class)
+        with lock.persist, lock.file.shared():
+            cls._catch_up()
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    @contextmanager
+    def _exclusive(cls):
+        """ In multi-process mode, hold the file lock of the class,
+        caught up with the writes of the other processes
+        """
+        file_lock = _lock(cls.__name__).file
+        if file_lock is None:
+            yield
+            return
+        with file_lock.exclusive():
+            cls._catch_up()
+            yield
+
+    @classmethod
+    def _catch_up(cls):
+        """ Apply the writes journaled since the last sync, or reload
+        when the snapshot was rewritten. Callers hold the file lock.
+        """
+        s_class = cls.__name__
+        state = SYNC.get(s_class)
+        journal = cls._journal()
+        if (state is None or state[0] != _file_key(cls._file_path())
+                or _file_size(journal.file_path) < state[1]):
+            cls._load()
+            return
+        records, offset = journal.read(state[1])
+        if records:
+            with _lock(s_class).rw.write():
+                cls._apply(records)
+        SYNC[s_class] = (state[0], offset)
+
+    @classmethod
+    def _apply(cls, records: list):
+        """ Apply journaled (op, id, obj_json) writes to the store and
+        its indexes. Callers hold the write lock of the class.
+        """
+        s_class = cls.__name__
+        store = DATA[s_class]
+        indexes = cls._indexes()
+        for op, obj_id, obj_json in records:
+            stored = _stored(s_class, obj_id)
+            if stored is not None:
+                cls._unindex(obj_id, stored)
+                del store[obj_id]
+            if op != OP_SAVE:
+                continue
+            if LAZY:
+                entry = obj_json
+                store.load(obj_id, entry)
+            else:
+                entry = cls(**obj_json)
+                store[obj_id] = entry
+            for attr, index in indexes.items():
+                index.add(obj_id, _value(entry, attr))
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
+
+        The file is a snapshot written aside and swapped in atomically,
+        see models.snapshot. Writers only wait for the objects to be
+        collected, not for the file to be written: snapshots are ordered
+        by the snapshot lock of the class, and in journal mode the
+        journal is rotated as the objects are collected. Backends other
+        than files persist each write.
+        """
+        if BACKEND is not None:
+            return
+        lock = _lock(cls.__name__)
+        if not MULTIPROCESS:
+            with lock.snapshot:
+                if JOURNAL:
+                    cls._snapshot()
+                else:
+                    write_snapshot(cls._file_path(), cls.serializer,
+                                   cls._snapshot_records())
+            return
+        # the other processes must not see the journal emptied before
+        # the snapshot is in place, so they wait for the whole snapshot
+        with lock.persist, cls._exclusive():
+            write_snapshot(cls._file_path(), cls.serializer,
+                           cls._snapshot_records())
+            cls._journal().truncate()
+            cls._journal().drop_rotated()
+            SYNC[cls.__name__] = (_file_key(cls._file_path()), 0)
+
+    @classmethod
+    def _snapshot(cls):
+        """ Snapshot the objects and drop the journal, in journal mode.
+        Callers hold the snapshot lock of the class.
+        """
+        lock = _lock(cls.__name__)
+        journal = cls._journal()
+        with lock.persist:
+            records = cls._snapshot_records()
+            journal.rotate()
+        write_snapshot(cls._file_path(), cls.serializer, records)
+        with lock.persist:
+            journal.drop_rotated()
+
+    @classmethod
+    def _snapshot_records(cls) -> dict:
+        """ Collect the records of all objects to persist: the cached
+        to_json(True) results, unless the serializer wants the
+        timestamps as datetimes
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
+        datetimes = cls.serializer.datetimes
         objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with _lock(s_class).rw.read():
+            for obj_id, obj in _records(s_class):
+                if isinstance(obj, dict):
+                    objs_json[obj_id] = obj
+                elif datetimes:
+                    objs_json[obj_id] = obj._serializable()
+                else:
+                    objs_json[obj_id] = obj.to_json(True)
+        return objs_json
+
+    @classmethod
+    def _compact(cls):
+        """ Snapshot the objects to empty a full journal, unless a
+        snapshot is already being written
+        """
+        lock = _lock(cls.__name__)
+        if MULTIPROCESS:
+            cls.save_to_file()
+        elif lock.snapshot.acquire(blocking=False):
+            try:
+                cls._snapshot()
+            finally:
+                lock.snapshot.release()
+
+    @classmethod
+    def _journal(cls) -> Journal:
+        """ Return the journal of the class
+        """
+        s_class = cls.__name__
+        if JOURNALS.get(s_class) is None:
+            JOURNALS[s_class] = Journal(journal_path(s_class))
+        return JOURNALS[s_class]
+
+    @classmethod
+    def _indexes(cls) -> dict:
+        """ Return the secondary indexes of the class, by attribute
+
+        Callers hold the `rw` lock of the class.
+        """
+        s_class = cls.__name__
+        if SECONDARY_INDEXES.get(s_class) is None:
+            indexes = {}
+            for attr, options in cls.INDEXES.items():
+                options = dict(options)
+                if options.pop('sorted', False):
+                    indexes[attr] = SortedIndex(attr, **options)
+                else:
+                    indexes[attr] = HashIndex(attr, **options)
+            records = list(_records(s_class))
+            for attr, index in indexes.items():
+                index.extend((obj_id, _value(obj, attr))
+                             for obj_id, obj in records)
+            SECONDARY_INDEXES[s_class] = indexes
+        return SECONDARY_INDEXES[s_class]
+
+    @classmethod
+    def _index(cls, obj: TypeVar('Base')):
+        """ Add an object to the secondary indexes
+        """
+        for attr, index in cls._indexes().items():
+            index.add(obj.id, getattr(obj, attr, None))
+
+    @classmethod
+    def _unindex(cls, obj_id: str, obj):
+        """ Remove an object, or raw record, from the secondary indexes
+        """
+        for attr, index in cls._indexes().items():
+            index.discard(obj_id, _value(obj, attr))
+
+    @classmethod
+    def _write(cls, op: str, obj: TypeVar('Base')):
+        """ Persist a write, or queue it in write-behind mode
+        """
+        global FLUSHER
+        if not WRITE_BEHIND:
+            cls._persist([(op, obj)])
+            return
+        if FLUSHER is None:
+            with _LOCKS_LOCK:
+                if FLUSHER is None:
+                    FLUSHER = Flusher(lambda klass, ops: klass._persist(ops),
+                                      FLUSH_INTERVAL, FLUSH_THRESHOLD)
+        FLUSHER.mark(cls, op, obj)
+
+    @classmethod
+    def _persist(cls, ops: list):
+        """ Persist the writes of a class: appended to the journal in
+        journal mode, compacting it when it is full or leaving that to
+        the background snapshots, otherwise by rewriting the file once
+        """
+        if not JOURNAL:
+            cls.save_to_file()
+            return
+        s_class = cls.__name__
+        with _lock(s_class).persist, cls._exclusive():
+            journal = cls._journal()
+            for op, obj in ops:
+                if op == OP_SAVE:
+                    journal.append(op, obj.id, obj.to_json(True))
+                else:
+                    journal.append(op, obj.id)
+                if SNAPSHOT_INTERVAL:
+                    _snapshotter().mark(cls, op, None)
+            if MULTIPROCESS:
+                SYNC[s_class] = (SYNC[s_class][0],
+                                 _file_size(journal.file_path))
+            if not SNAPSHOT_INTERVAL and journal.entries >= JOURNAL_THRESHOLD:
+                cls._compact()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def flush(cls):
+        """ Persist the writes queued in write-behind mode, and write the
+        pending background snapshots
+        """
+        if FLUSHER is not None:
+            FLUSHER.flush()
+        if SNAPSHOTTER is not None:
+            SNAPSHOTTER.flush()
+
+    @classmethod
+    def _commit(cls, op: str, obj: TypeVar('Base'), change: Callable):
+        """ Apply a write to the store with `change()`, then persist it
+        unless `change()` returned False
+
+        In journal mode, the persist lock is held until the write is
+        journaled, so the journal gets the writes in the order they were
+        applied. In write-behind mode, writes are queued before the
+        store is unlocked, for the same reason, and never wait for the
+        file. Otherwise, the file is rewritten after the store is
+        unlocked, see save_to_file.
+        """
+        lock = _lock(cls.__name__)
+        if JOURNAL and not WRITE_BEHIND:
+            with lock.persist, cls._exclusive():
+                with lock.rw.write():
+                    changed = change()
+                if changed:
+                    cls._write(op, obj)
+            return
+        with lock.rw.write():
+            changed = change()
+            if changed and WRITE_BEHIND:
+                cls._write(op, obj)
+        if changed and not WRITE_BEHIND:
+            cls._write(op, obj)
+
+    def _store(self) -> bool:
+        """ Check the unique indexes, stamp the object and put it in the
+        store and the indexes. Callers hold the write lock of the class.
+        """
+        cls = self.__class__
+        s_class = cls.__name__
+        indexes = cls._indexes()
+        stored = _stored(s_class, self.id)
+        for attr, index in indexes.items():
+            # only values the index does not hold yet for this object:
+            # duplicates stored before uniqueness was enforced can still
+            # be saved
+            value = getattr(self, attr, None)
+            if (value != _value(stored, attr)
+                    and index.conflicts(self.id, value)):
+                raise ValueError("{} already exists".format(attr))
+        self._assign('updated_at', datetime.utcnow(),
+                     indexes.get('updated_at') if stored is self else None)
+        if stored is not self:
+            if stored is not None:
+                cls._unindex(self.id, stored)
+            DATA[s_class][self.id] = self
+            cls._index(self)
+        return True
+
+    def _unstore(self) -> bool:
+        """ Take the object out of the store and the indexes, returns
+        whether it was stored. Callers hold the write lock of the class.
+        """
+        cls = self.__class__
+        s_class = cls.__name__
+        stored = _stored(s_class, self.id)
+        if stored is None:
+            return False
+        cls._unindex(self.id, stored)
+        del DATA[s_class][self.id]
+        return True
 
     def save(self):
         """ Save current object
+
+        Raises a ValueError when a unique index already holds the value
+        of this object for another object.
         """
-        s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        if BACKEND is not None:
+            self.updated_at = datetime.utcnow()
+            BACKEND.save(self)
+            return
+        self.__class__._commit(OP_SAVE, self, self._store)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        if BACKEND is not None:
+            BACKEND.remove(self)
+            return
+        self.__class__._commit(OP_REMOVE, self, self._unstore)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        if BACKEND is not None:
+            return BACKEND.count(cls)
         s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        cls._sync()
+        with _lock(s_class).rw.read():
+            return len(DATA[s_class].keys())
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,26 +754,117 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, limit: int, after: str = None) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects in id order, starting after
+        the id `after`
+
+        Ids give a stable order to page through the store while it
+        changes, and only `limit` ids are kept while scanning it. To go
+        through the whole store, `pages` sorts the ids only once.
+        """
+        if BACKEND is not None:
+            return BACKEND.page(cls, limit, after)
+        s_class = cls.__name__
+        cls._sync()
+        with _lock(s_class).rw.read():
+            store = DATA[s_class]
+            obj_ids = iter(store)
+            if after is not None:
+                obj_ids = filter(after.__lt__, obj_ids)
+            return [store[obj_id]
+                    for obj_id in heapq.nsmallest(limit, obj_ids)]
+
+    @classmethod
+    def pages(cls, size: int,
+              after: str = None) -> Iterator[List[TypeVar('Base')]]:
+        """ Iterate over all objects in id order, at most `size` at a
+        time, starting after the id `after`
+
+        The ids are sorted once, when the iteration starts: objects
+        created since are left out, and removed ones are skipped. The
+        sorted ids are kept until the iteration ends, so its memory
+        grows with the number of objects.
+        """
+        if BACKEND is not None:
+            while True:
+                objs = BACKEND.page(cls, size, after)
+                if objs:
+                    yield objs
+                if len(objs) < size:
+                    return
+                after = objs[-1].id
+        s_class = cls.__name__
+        cls._sync()
+        with _lock(s_class).rw.read():
+            obj_ids = sorted(DATA[s_class])
+        first = 0 if after is None else bisect_right(obj_ids, after)
+        for start in range(first, len(obj_ids), size):
+            with _lock(s_class).rw.read():
+                store = DATA[s_class]
+                objs = [store.get(obj_id)
+                        for obj_id in obj_ids[start:start + size]]
+            objs = [obj for obj in objs if obj is not None]
+            if objs:
+                yield objs
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        if BACKEND is not None:
+            return BACKEND.get(cls, id)
         s_class = cls.__name__
-        return DATA[s_class].get(id)
+        cls._sync()
+        with _lock(s_class).rw.read():
+            return DATA[s_class].get(id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        Attributes are matched by equality, or by a predicate of
+        models.query, e.g.:
+            {'email': Prefix('bob@'), 'created_at': Range(start, end)}
         """
-        if not path.exists(".db_User.json"):
+        if not storage_exists("User"):
             return True
+        if BACKEND is not None:
+            return BACKEND.search(cls, attributes)
         s_class = cls.__name__
+        cls._sync()
+        with _lock(s_class).rw.read():
+            store = DATA[s_class]
+            plan = Plan(attributes, cls._indexes())
+            obj_ids = plan.candidates()
+            filters = plan.filters
+            if isinstance(store, LazyStore):
+                return [store[obj_id]
+                        for obj_id in store.matching(filters, obj_ids)]
+            if obj_ids is None:
+                objs = list(store.values())
+            else:
+                objs = [store[obj_id] for obj_id in obj_ids]
+
         def _search(obj):
-            if len(attributes) == 0:
+            if len(filters) == 0:
                 return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
+            for k, pred in filters.items():
+                if not pred.match(getattr(obj, k)):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return list(filter(_search, objs))
+
+    @classmethod
+    def explain(cls, attributes: dict = {}) -> dict:
+        """ Return the plan `search` follows for a query: the index
+        scans intersected into candidates, then the attributes checked
+        on each candidate (see models.query.Plan), or the plan of the
+        backend
+        """
+        if BACKEND is not None:
+            return BACKEND.explain(cls, attributes)
+        s_class = cls.__name__
+        cls._sync()
+        with _lock(s_class).rw.read():
+            return Plan(attributes, cls._indexes()).explain()
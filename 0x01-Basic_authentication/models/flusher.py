@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+""" Flusher module
+
+Write-behind persistence: writes are queued per model class and a
+background thread persists them once per interval, or as soon as
+enough of them are pending.
+"""
+import atexit
+import sys
+import threading
+import traceback
+from typing import Callable
+
+
+class Flusher():
+    """ Background thread persisting queued writes
+
+    `persist(cls, ops)` is called with each class and the list of its
+    (op, obj) writes, in order, since the previous flush.
+    """
+
+    def __init__(self, persist: Callable, interval: float = 1.0,
+                 threshold: int = 100, name: str = "model-flusher"):
+        """ Initialize and start the flusher
+
+        Args:
+            persist: Persists the writes of one class.
+            interval: Maximum seconds between a write and its flush,
+                i.e. the durability window.
+            threshold: Number of pending writes triggering an
+                immediate flush.
+            name: Name of the thread.
+        """
+        self._persist = persist
+        self.interval = interval
+        self.threshold = threshold
+        self._pending = {}
+        self._flushing = {}
+        self._count = 0
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=name)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def mark(self, cls: type, op: str, obj):
+        """ Queue a write of an object of a class
+        """
+        with self._cond:
+            self._pending.setdefault(cls, []).append((op, obj))
+            self._count += 1
+            if self._count >= self.threshold:
+                self._cond.notify()
+
+    def pending(self, class_name: str) -> bool:
+        """ Whether writes of a class, given by name, are queued or
+        being persisted
+        """
+        with self._cond:
+            return any(cls.__name__ == class_name
+                       for queue in (self._pending, self._flushing)
+                       for cls in queue)
+
+    def flush(self):
+        """ Persist every pending write now
+        """
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+                self._flushing = pending
+                self._count = 0
+            for cls, ops in pending.items():
+                try:
+                    self._persist(cls, ops)
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+                    with self._cond:
+                        self._pending.setdefault(cls, [])[:0] = ops
+                        self._count += len(ops)
+            with self._cond:
+                self._flushing = {}
+
+    def _run(self):
+        """ Flush every interval, or when the threshold is reached
+        """
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or self._count >= self.threshold,
+                    timeout=self.interval)
+                if self._stopping:
+                    return
+            self.flush()
+
+    def stop(self):
+        """ Stop the thread and persist the remaining writes
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
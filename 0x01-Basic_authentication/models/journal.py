@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+""" Journal module
+
+Append-only log of the writes made to a model class since its last
+snapshot (`.db_<Class>.json`). Each line is a compact JSON record:
+    {"op": "save", "id": "...", "obj": {...}}
+    {"op": "remove", "id": "..."}
+While a snapshot is being written, the writes it holds are moved aside
+to `<journal>.old`, and new writes go to a new journal.
+"""
+import json
+import os
+from typing import List, Tuple
+
+
+OP_SAVE = "save"
+OP_REMOVE = "remove"
+
+
+def journal_path(s_class: str) -> str:
+    """ Path of the journal of a model class
+    """
+    return ".db_{}.journal".format(s_class)
+
+
+class Journal():
+    """ Journal of one model class
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a Journal on a file, created on first append
+        """
+        self.file_path = file_path
+        self.rotated_path = file_path + ".old"
+        self.entries = 0
+        self._file = None
+
+    def append(self, op: str, obj_id: str, obj_json: dict = None):
+        """ Append a write to the journal
+        """
+        record = {"op": op, "id": obj_id}
+        if obj_json is not None:
+            record["obj"] = obj_json
+        if self._file is None:
+            self._file = open(self.file_path, 'a')
+        self._file.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self._file.flush()
+        self.entries += 1
+
+    def read(self, offset: int = 0) -> Tuple[List[Tuple[str, str, dict]],
+                                             int]:
+        """ Return the (op, id, obj_json) journaled from a byte offset,
+        and the offset following the last complete line read
+
+        An incomplete last line, torn by a crash or still being
+        appended by another process, is left for the next read.
+        """
+        if offset == 0:
+            self.entries = 0
+        return self._read(self.file_path, offset)
+
+    def read_rotated(self) -> List[Tuple[str, str, dict]]:
+        """ Return the (op, id, obj_json) of the rotated journal, left by
+        a snapshot being written, or which did not complete
+        """
+        records, _ = self._read(self.rotated_path, 0)
+        return records
+
+    def _read(self, file_path: str,
+              offset: int) -> Tuple[List[Tuple[str, str, dict]], int]:
+        """ Read the complete lines of a journal file from an offset
+        """
+        try:
+            f = open(file_path, 'rb')
+        except FileNotFoundError:
+            return [], offset
+        with f:
+            f.seek(offset)
+            data = f.read()
+        records = []
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self.entries += 1
+            records.append((record["op"], record["id"], record.get("obj")))
+        return records, offset
+
+    def truncate(self):
+        """ Empty the journal, once its writes are in a snapshot
+        """
+        self.close()
+        open(self.file_path, 'w').close()
+        self.entries = 0
+
+    def rotate(self):
+        """ Move the journaled writes aside, before they are snapshotted
+
+        A rotated journal left by a snapshot which did not complete
+        keeps its writes, followed by the current ones.
+        """
+        self.close()
+        if os.path.exists(self.rotated_path):
+            try:
+                with open(self.file_path, 'rb') as src:
+                    data = src.read()
+            except FileNotFoundError:
+                data = b""
+            with open(self.rotated_path, 'ab') as dst:
+                dst.write(data)
+                dst.flush()
+                os.fsync(dst.fileno())
+            if os.path.exists(self.file_path):
+                os.remove(self.file_path)
+        elif os.path.exists(self.file_path):
+            os.replace(self.file_path, self.rotated_path)
+        self.entries = 0
+
+    def drop_rotated(self):
+        """ Delete the rotated journal, once its writes are snapshotted
+        """
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    def close(self):
+        """ Close the journal file
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
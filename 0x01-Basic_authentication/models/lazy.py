@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+""" Lazy store module
+
+Object store that keeps the raw JSON records loaded from file and only
+builds model objects when they are first accessed.
+"""
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import threading
+from typing import Iterable, Iterator, Tuple, TypeVar
+
+
+class LazyStore(MutableMapping):
+    """ Mapping of id -> object, hydrated on first access
+
+    Entries hold either a raw record (a dict, as serialized by
+    `to_json(True)`) or a hydrated object. When `cache_size` is set,
+    at most that many objects stay hydrated: the least recently used
+    ones are turned back into raw records.
+
+    Reads may build objects, so every access is guarded by an internal
+    lock: the store is safe to read from several threads at once.
+    """
+
+    def __init__(self, cls: type, cache_size: int = 0,
+                 converted: Iterable[str] = ()):
+        """ Initialize an empty store for a model class
+
+        `converted` names the attributes whose raw value differs from
+        the attribute value (e.g. timestamps), which can only be
+        compared on hydrated objects.
+        """
+        self._cls = cls
+        self._entries = {}
+        self._hydrated = OrderedDict()
+        self._lock = threading.RLock()
+        self.cache_size = cache_size
+        self.converted = frozenset(converted)
+
+    def load(self, obj_id: str, record: dict):
+        """ Store a raw record, without building its object
+        """
+        with self._lock:
+            self._entries[obj_id] = record
+            self._hydrated.pop(obj_id, None)
+
+    def peek(self, obj_id: str):
+        """ Return the object or raw record of an id, without hydrating
+        """
+        return self._entries.get(obj_id)
+
+    def records(self) -> Iterator[Tuple[str, object]]:
+        """ Iterate over (id, object or raw record), without hydrating
+        """
+        with self._lock:
+            return iter(list(self._entries.items()))
+
+    def matching(self, predicates: dict,
+                 obj_ids: Iterable[str] = None) -> Iterator[str]:
+        """ Ids of the entries whose attributes satisfy the predicates
+        (see models.query), by attribute
+
+        Raw records are compared without being hydrated whenever the
+        raw value is comparable with the queried one.
+        """
+        with self._lock:
+            if obj_ids is None:
+                obj_ids = list(self._entries)
+            entries = [(obj_id, self._entries.get(obj_id))
+                       for obj_id in obj_ids]
+        for obj_id, entry in entries:
+            if entry is None:
+                continue
+            if isinstance(entry, dict):
+                comparable = True
+                for k, pred in predicates.items():
+                    if k in self.converted or k not in entry:
+                        comparable = False
+                        break
+                    if not pred.match(entry[k]):
+                        break
+                else:
+                    yield obj_id
+                    continue
+                if comparable:
+                    continue
+                try:
+                    entry = self[obj_id]
+                except KeyError:
+                    continue
+            if all(pred.match(getattr(entry, k))
+                   for k, pred in predicates.items()):
+                yield obj_id
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        with self._lock:
+            entry = self._entries[obj_id]
+            if isinstance(entry, dict):
+                entry = self._cls(**entry)
+                self._entries[obj_id] = entry
+                self._hydrated[obj_id] = None
+                self._evict()
+            else:
+                self._hydrated.move_to_end(obj_id)
+            return entry
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        with self._lock:
+            self._entries[obj_id] = obj
+            self._hydrated[obj_id] = None
+            self._hydrated.move_to_end(obj_id)
+            self._evict()
+
+    def __delitem__(self, obj_id: str):
+        with self._lock:
+            del self._entries[obj_id]
+            self._hydrated.pop(obj_id, None)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self):
+        """ Turn the least recently used objects back into raw records
+        """
+        while self.cache_size and len(self._hydrated) > self.cache_size:
+            obj_id, _ = self._hydrated.popitem(last=False)
+            self._entries[obj_id] = self._entries[obj_id].to_json(True)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+""" Locking module
+
+Locks guarding the object store of each model class.
+"""
+from contextlib import contextmanager
+import os
+import threading
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class RWLock():
+    """ Readers-writer lock
+
+    Any number of readers may hold the lock at once, writers hold it
+    alone. Waiting writers go first, so a steady flow of readers cannot
+    starve them. The lock is not reentrant.
+    """
+
+    def __init__(self):
+        """ Initialize an unlocked lock
+        """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """ Hold the lock for reading
+        """
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """ Hold the lock for writing
+        """
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class FileLock():
+    """ Advisory lock on a file, shared between processes (flock)
+
+    Nested holds in one process only count, the lock is released with
+    the outermost one. Threads are not told apart: callers serialize
+    them, e.g. with the `persist` lock of a class.
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a lock on a file, created on first hold
+        """
+        if fcntl is None:
+            raise OSError("File locks are not supported on this platform")
+        self.file_path = file_path
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self):
+        """ Hold the lock along with other readers
+        """
+        with self._hold(False):
+            yield
+
+    @contextmanager
+    def exclusive(self):
+        """ Hold the lock alone
+        """
+        with self._hold(True):
+            yield
+
+    @contextmanager
+    def _hold(self, exclusive: bool):
+        """ Hold the lock, or nest in a hold of this process
+        """
+        if self._depth == 0:
+            if self._pid != os.getpid():
+                # a forked child must not share the lock of its parent
+                self._fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT,
+                                   0o644)
+                self._pid = os.getpid()
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive
+                        else fcntl.LOCK_SH)
+            self._exclusive = exclusive
+        elif exclusive and not self._exclusive:
+            raise RuntimeError("Cannot upgrade a shared file lock")
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class ClassLock():
+    """ Locks of the store of one model class
+
+    `rw` guards the objects and indexes of the class in memory.
+    `persist` serializes journaled writes and loads: in journal mode it
+    is held for the whole of a save/remove, so the journal always
+    reflects the writes in the order they were applied. Write-behind
+    writes only hold `rw`, while queuing the write.
+    `file`, in multi-process mode, extends `persist` to the processes
+    sharing the files of the store.
+    `snapshot` serializes the snapshots of the class, i.e. the rewrites
+    of its file. It is taken before `persist`, never while holding it.
+    """
+
+    def __init__(self, file_path: str = None):
+        """ Initialize the locks, with a file lock on `file_path`
+        """
+        self.rw = RWLock()
+        self.persist = threading.RLock()
+        self.file = FileLock(file_path) if file_path else None
+        self.snapshot = threading.Lock()
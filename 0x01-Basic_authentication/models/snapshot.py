@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+""" Snapshot module
+
+Crash-safe snapshot files of the model store. A snapshot is the output
+of a serializer, unchanged, and its checksum is kept aside in
+`<path>.crc32`:
+    <crc32 as 8 hex digits> <size> <mtime in ns>\n
+The snapshot is written to `<path>.tmp` and synced, its checksum file
+likewise, then both are renamed over `<path>` and `<path>.crc32`, the
+snapshot they replace being kept as `<path>.prev`: a crash leaves one
+or the other whole, and a snapshot which is missing or fails its
+checksum is read from `<path>.prev` instead.
+
+The checksum only applies to the file it was written with, told by
+its size and modification time. A snapshot rewritten by other means
+(or left in place by a crash between the two renames) is trusted as
+long as its serializer can read it.
+"""
+import os
+import shutil
+import struct
+import sys
+import zlib
+
+
+CHECKSUM = ".crc32"
+PREVIOUS = ".prev"
+
+
+class CorruptSnapshot(ValueError):
+    """ Snapshot failing its checksum, or unreadable by its serializer
+    """
+
+
+def _sync_dir(file_path: str):
+    """ Persist the renames made in the directory of a file
+    """
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(os.path.dirname(file_path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _keep(file_path: str, kept_path: str):
+    """ Keep a copy of a file, linked rather than moved: the file never
+    goes missing while it is replaced
+    """
+    if not os.path.exists(file_path):
+        return
+    if os.path.exists(kept_path):
+        os.remove(kept_path)
+    try:
+        os.link(file_path, kept_path)
+    except OSError:
+        shutil.copy2(file_path, kept_path)
+
+
+def write_snapshot(file_path: str, serializer, records: dict):
+    """ Write the records of a store to a snapshot, atomically
+    """
+    tmp_path = file_path + ".tmp"
+    data = serializer.dumps(records)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        st = os.fstat(f.fileno())
+    with open(tmp_path + CHECKSUM, 'w') as f:
+        f.write("{:08x} {} {}\n".format(zlib.crc32(data), st.st_size,
+                                        st.st_mtime_ns))
+        f.flush()
+        os.fsync(f.fileno())
+    _keep(file_path, file_path + PREVIOUS)
+    _keep(file_path + CHECKSUM, file_path + PREVIOUS + CHECKSUM)
+    # the checksum goes first: should the snapshot rename not happen,
+    # it does not describe the snapshot left in place
+    os.replace(tmp_path + CHECKSUM, file_path + CHECKSUM)
+    os.replace(tmp_path, file_path)
+    _sync_dir(file_path)
+
+
+def _checksum(file_path: str, st: os.stat_result):
+    """ Checksum recorded for a snapshot, None when there is none for
+    this very file
+    """
+    try:
+        with open(file_path + CHECKSUM) as f:
+            crc, size, mtime_ns = f.read().split()
+    except (FileNotFoundError, ValueError):
+        return None
+    if int(mtime_ns) != st.st_mtime_ns:
+        return None
+    if int(size) != st.st_size:
+        # the checksum describes this file, which lost data since
+        return -1
+    return int(crc, 16)
+
+
+def read_snapshot(file_path: str, serializer) -> dict:
+    """ Read the records of a snapshot
+
+    Raises CorruptSnapshot when the checksum or the records are wrong.
+    """
+    with open(file_path, 'rb') as f:
+        crc = _checksum(file_path, os.fstat(f.fileno()))
+        data = f.read()
+    if crc is not None and zlib.crc32(data) != crc:
+        raise CorruptSnapshot("{}: wrong checksum".format(file_path))
+    try:
+        return serializer.loads(data)
+    except (ValueError, IndexError, KeyError, struct.error) as e:
+        raise CorruptSnapshot("{}: {}".format(file_path, e)) from e
+
+
+def load_snapshot(file_path: str, serializer) -> dict:
+    """ Read the records of a snapshot, or of the previous one when it
+    is missing or corrupt. Returns None when neither exists.
+    """
+    error = None
+    for candidate in (file_path, file_path + PREVIOUS):
+        try:
+            records = read_snapshot(candidate, serializer)
+        except FileNotFoundError:
+            continue
+        except CorruptSnapshot as e:
+            error = error or e
+            print("Skipping snapshot {}".format(e), file=sys.stderr)
+            continue
+        return records
+    if error is not None:
+        raise error
+    return None
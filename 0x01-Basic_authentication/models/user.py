@@ -2,13 +2,18 @@
 """ User module
 """
 import hashlib
-from models.base import Base
+from models.base import Base, COMPACT
 
 
 class User(Base):
     """ User class
     """
 
+    INDEXES = dict(Base.INDEXES, email={'unique': True, 'sorted': True})
+    INTERNED = ('first_name', 'last_name')
+    if COMPACT:
+        __slots__ = ('email', '_password', 'first_name', 'last_name')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -5,13 +5,77 @@ class to manage the API authentication.
 
 
 from flask import request
-from typing import List, TypeVar
+from functools import lru_cache
+from typing import Iterable, List, TypeVar
 import os
 
 
+# Number of compiled lists of excluded paths kept, and of path results
+# memoized by each of them
+MATCHER_CACHE_SIZE = 16
+PATH_CACHE_SIZE = 1024
+
+
+class PathMatcher:
+    """Excluded paths compiled for lookups in O(path length)
+
+    Paths ending with "*" match every path starting with what precedes
+    the "*" and are kept in a prefix trie, the others only match
+    themselves and are kept in a set. The results of the most recently
+    matched paths are memoized.
+    """
+
+    def __init__(self, excluded_paths: Iterable[str]):
+        """Compile the excluded paths"""
+        self.exact = set()
+        self.trie = {}
+        for excluded_path in excluded_paths:
+            if excluded_path.endswith("*"):
+                node = self.trie
+                for char in excluded_path[:-1]:
+                    node = node.setdefault(char, {})
+                # None marks the end of a wildcard prefix
+                node[None] = True
+            else:
+                self.exact.add(excluded_path)
+        self.match = lru_cache(maxsize=PATH_CACHE_SIZE)(self._match)
+
+    def _match(self, path: str) -> bool:
+        """Whether a path is excluded"""
+        if path in self.exact:
+            return True
+        node = self.trie
+        for char in path:
+            if None in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return None in node
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def compile_paths(excluded_paths: tuple) -> PathMatcher:
+    """Compiled matcher of a tuple of excluded paths"""
+    return PathMatcher(excluded_paths)
+
+
 class Auth:
     """Auth class to manage the API authentication"""
 
+    # last list of excluded paths given and its matcher
+    _compiled = None
+
+    def _matcher(self, excluded_paths: List[str]) -> PathMatcher:
+        """Compiled matcher of excluded paths, kept as long as the same
+        list is given: the list must not be changed in place"""
+        compiled = self._compiled
+        if compiled is None or compiled[0] is not excluded_paths:
+            compiled = (excluded_paths,
+                        compile_paths(tuple(excluded_paths)))
+            self._compiled = compiled
+        return compiled[1]
+
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """Require authentication"""
         if path is None:
@@ -21,15 +85,7 @@ class Auth:
         if excluded_paths is None or not excluded_paths:
             return True
 
-        for excluded_path in excluded_paths:
-            if excluded_path.endswith("*") and path.startswith(
-                excluded_path[:-1]
-            ):
-                return False
-            elif path == excluded_path:
-                return False
-
-        return True
+        return not self._matcher(excluded_paths).match(path)
 
     def authorization_header(self, request=None) -> str:
         """Authorization header"""
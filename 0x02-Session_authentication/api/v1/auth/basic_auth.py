@@ -7,8 +7,8 @@ class to manage the API authentication.
 from api.v1.auth.auth import Auth
 from typing import TypeVar
 import base64
+from models.base import storage_exists
 from models.user import User
-import os
 
 
 class BasicAuth(Auth):
@@ -127,7 +127,7 @@ class BasicAuth(Auth):
             return None
         if user_pwd is None or not isinstance(user_pwd, str):
             return None
-        if not os.path.exists(".db_User.json"):
+        if not storage_exists("User"):
             return None
         users = User.search({'email': user_email})
         if not users:
@@ -22,7 +22,7 @@ class SessionDBAuth(SessionExpAuth):
     def user_id_for_session_id(self, session_id=None):
         if session_id is None:
             return None
-        data = UserSession.serach({'session_id': session_id})
+        data = UserSession.search({'session_id': session_id})
         if data:
             return data[0].user_id
 
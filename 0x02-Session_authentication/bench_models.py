@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+""" Benchmarks of the model storage
+
+Usage:
+    ./bench_models.py memory [count]
+        bytes per loaded User, with the regular and compact layouts
+    ./bench_models.py serialization [count]
+        save_to_file / load_from_file throughput of each file format
+    ./bench_models.py stress [operations]
+        mixed save/get/search/remove/save_to_file from 1, 2, 4 and 8
+        threads: checks the store stays consistent and reports ops/s
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+
+FIRST_NAMES = ["Bob", "Alice", "Ruth", "Marlene", "Kallie", "Rhianna"]
+
+
+def make_records(count: int) -> dict:
+    """ Build `count` serialized users
+    """
+    records = {}
+    for i in range(count):
+        obj_id = str(uuid.uuid4())
+        records[obj_id] = {
+            "id": obj_id,
+            "created_at": "2024-04-17T20:23:31",
+            "updated_at": "2024-04-17T20:23:31",
+            "email": "user{}@hbtn.io".format(i),
+            "_password": uuid.uuid4().hex + uuid.uuid4().hex,
+            "first_name": FIRST_NAMES[i % len(FIRST_NAMES)],
+            "last_name": None,
+        }
+    return records
+
+
+def measure_memory(count: int) -> float:
+    """ Bytes allocated per User by load_from_file, in the layout
+    selected by the environment of this process
+    """
+    from models.user import User
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        with open(".db_User.json", 'w') as f:
+            json.dump(make_records(count), f)
+        tracemalloc.start()
+        User.load_from_file()
+        User.count()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return size / count
+
+
+def memory(count: int):
+    """ Compare the memory of the regular and compact layouts, each in
+    its own process since the layout is chosen at import
+    """
+    for label, compact in (("regular", "0"), ("compact", "1")):
+        env = dict(os.environ, DB_COMPACT=compact, DB_LAZY="0")
+        out = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), "_memory",
+             str(count)], env=env, cwd=os.path.dirname(
+                 os.path.abspath(__file__)))
+        print("{:<8} {:>8.0f} bytes/object".format(
+            label, float(out.decode())))
+
+
+def serialization(count: int):
+    """ Time save_to_file and load_from_file with each serializer
+    """
+    from models.base import DATA, SERIALIZERS
+    from models.user import User
+    records = make_records(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        for name, serializer in SERIALIZERS.items():
+            User.serializer = serializer
+            DATA['User'] = {obj_id: User(**record)
+                            for obj_id, record in records.items()}
+            start = time.perf_counter()
+            User.save_to_file()
+            save_time = time.perf_counter() - start
+            start = time.perf_counter()
+            User.load_from_file()
+            load_time = time.perf_counter() - start
+            print("{:<8} save {:>9.0f} objects/s  load {:>9.0f} objects/s"
+                  "  {:>9} bytes".format(
+                      name, count / save_time, count / load_time,
+                      os.path.getsize(User._file_path())))
+
+
+def stress_run(threads: int, operations: int) -> float:
+    """ Run `operations` mixed operations split over `threads` threads,
+    raise when one of them fails or the store ends up inconsistent, and
+    return the throughput in operations/s
+    """
+    from models.base import DATA, SECONDARY_INDEXES
+    from models.user import User
+    DATA['User'] = {}
+    SECONDARY_INDEXES.pop('User', None)
+    User.save_to_file()
+    errors = []
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(n: int):
+        mine = []
+        barrier.wait()
+        try:
+            for i in range(operations // threads):
+                step = i % 10
+                if step < 4 or not mine:
+                    user = User(email="t{}-{}@hbtn.io".format(n, i),
+                                first_name=FIRST_NAMES[i % len(FIRST_NAMES)])
+                    user.save()
+                    mine.append(user)
+                elif step < 7:
+                    assert User.get(mine[-1].id) is mine[-1]
+                elif step < 9:
+                    found = User.search({'email': mine[0].email})
+                    assert [u.id for u in found] == [mine[0].id]
+                elif i % 100 == 9:
+                    User.save_to_file()
+                else:
+                    mine.pop().remove()
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(n,))
+               for n in range(threads)]
+    for t in workers:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    User.flush()
+    if errors:
+        raise errors[0]
+    emails = User._indexes()['email']
+    for user in User.all():
+        assert emails.lookup(user.email) == [user.id]
+    User.save_to_file()
+    User.load_from_file()
+    assert User.count() == len(DATA['User'])
+    return operations / elapsed
+
+
+def stress(operations: int):
+    """ Stress the store from a growing number of threads
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        for threads in (1, 2, 4, 8):
+            print("{} threads {:>9.0f} ops/s".format(
+                threads, stress_run(threads, operations)))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    command = sys.argv[1] if len(sys.argv) > 1 else "memory"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    if command == "memory":
+        memory(count)
+    elif command == "serialization":
+        serialization(count)
+    elif command == "stress":
+        stress(int(sys.argv[2]) if len(sys.argv) > 2 else 4000)
+    elif command == "_memory":
+        print(measure_memory(count))
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+""" Compact module
+
+Helpers for the compact object layout, where model classes use
+__slots__ instead of a per-instance __dict__ and store timestamps as
+integer seconds.
+"""
+from datetime import datetime, timedelta
+from typing import Iterator, Tuple
+
+
+EPOCH = datetime(1970, 1, 1)
+_SLOT_NAMES = {}
+
+
+class TimestampField():
+    """ Descriptor exposing a slot of integer seconds as a datetime
+    """
+
+    def __init__(self, slot: str):
+        """ Initialize the descriptor on the slot holding the seconds
+        """
+        self.slot = slot
+        self.name = None
+
+    def __set_name__(self, owner: type, name: str):
+        self.name = name
+
+    def __get__(self, obj, owner: type = None):
+        if obj is None:
+            return self
+        try:
+            seconds = getattr(obj, self.slot)
+        except AttributeError:
+            raise AttributeError(self.name) from None
+        return EPOCH + timedelta(seconds=seconds)
+
+    def __set__(self, obj, value: datetime):
+        setattr(obj, self.slot, int((value - EPOCH).total_seconds()))
+
+
+def slot_names(cls: type) -> Tuple[str, ...]:
+    """ Names of the slots of a class and its parents, parents first
+    """
+    names = _SLOT_NAMES.get(cls)
+    if names is None:
+        names = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get('__slots__', ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            names.extend(slot for slot in slots
+                         if slot not in ('__dict__', '__weakref__'))
+        names = tuple(names)
+        _SLOT_NAMES[cls] = names
+    return names
+
+
+def compact_attributes(obj, aliases: dict) -> Iterator[Tuple[str, object]]:
+    """ Iterate over the (name, value) of the set attributes of an object
+
+    `aliases` maps the slots holding a descriptor's storage to the
+    public name of the descriptor (e.g. '_created_ts' -> 'created_at').
+    """
+    for slot in slot_names(type(obj)):
+        name = aliases.get(slot, slot)
+        try:
+            yield name, getattr(obj, name)
+        except AttributeError:
+            continue
+    if hasattr(obj, '__dict__'):
+        yield from obj.__dict__.items()
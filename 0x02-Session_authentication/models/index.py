@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+""" Index module
+
+Secondary indexes of a model class, mapping attribute values to the
+ids of the objects holding them.
+
+Indexes serve the predicates of models.query: `supports(predicate)`
+tells whether an index can, `estimate(predicate)` cheaply counts the
+ids it would return and `find(predicate)` returns them.
+"""
+from bisect import bisect_left, insort
+from datetime import datetime
+from itertools import islice
+from typing import Hashable, Iterable, Iterator, Tuple
+
+
+# Number of items of the chunks of a SortedList: a chunk is split once
+# it holds twice as many
+CHUNK_SIZE = 512
+
+
+def sort_key(value):
+    """ Ordered form of a value: datetimes become ISO 8601 strings to
+    the second, the format timestamps are stored in, which sort in
+    time order
+    """
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    return value
+
+
+def successor(key: str) -> str:
+    """ Smallest string greater than every string starting with `key`,
+    None when there is none
+    """
+    if not key or key[-1] == chr(0x10ffff):
+        return None
+    return key[:-1] + chr(ord(key[-1]) + 1)
+
+
+class SortedList():
+    """ List of comparable items kept sorted, in chunks of at most
+    2 * CHUNK_SIZE items
+
+    Adding or removing an item costs O(log n + CHUNK_SIZE), instead of
+    the O(n) of inserting into a single list.
+    """
+
+    def __init__(self, items: Iterable = ()):
+        """ Initialize the list with items, sorting them at once
+        """
+        items = sorted(items)
+        self._chunks = [items[i:i + CHUNK_SIZE]
+                        for i in range(0, len(items), CHUNK_SIZE)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(items)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def add(self, item):
+        """ Insert an item at its place
+        """
+        if not self._chunks:
+            self._chunks.append([item])
+            self._maxes.append(item)
+            self._len = 1
+            return
+        i = min(bisect_left(self._maxes, item), len(self._maxes) - 1)
+        chunk = self._chunks[i]
+        insort(chunk, item)
+        self._maxes[i] = chunk[-1]
+        self._len += 1
+        if len(chunk) > 2 * CHUNK_SIZE:
+            self._chunks[i:i + 1] = [chunk[:CHUNK_SIZE], chunk[CHUNK_SIZE:]]
+            self._maxes[i:i + 1] = [chunk[CHUNK_SIZE - 1], chunk[-1]]
+
+    def remove(self, item) -> bool:
+        """ Remove an item, returns whether it was in the list
+        """
+        i = bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            return False
+        chunk = self._chunks[i]
+        j = bisect_left(chunk, item)
+        if chunk[j] != item:
+            return False
+        del chunk[j]
+        self._len -= 1
+        if chunk:
+            self._maxes[i] = chunk[-1]
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+        return True
+
+    def _position(self, item) -> Tuple[int, int]:
+        """ (chunk, index in the chunk) of the first item >= `item`
+        """
+        i = bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            return i, 0
+        return i, bisect_left(self._chunks[i], item)
+
+    def irange(self, start=None, stop=None) -> Iterator:
+        """ Iterate over the items in [start, stop), either bound being
+        optional
+        """
+        i, j = self._position(start) if start is not None else (0, 0)
+        for chunk in self._chunks[i:]:
+            for item in islice(chunk, j, None):
+                if stop is not None and not item < stop:
+                    return
+                yield item
+            j = 0
+
+    def count(self, start=None, stop=None) -> int:
+        """ Number of items in [start, stop), either bound being optional
+        """
+        i, j = self._position(start) if start is not None else (0, 0)
+        k, m = (self._position(stop) if stop is not None
+                else (len(self._chunks), 0))
+        if (i, j) >= (k, m):
+            return 0
+        if i == k:
+            return m - j
+        return (len(self._chunks[i]) - j
+                + sum(len(chunk) for chunk in self._chunks[i + 1:k]) + m)
+
+
+class HashIndex():
+    """ Hash index on one attribute: O(1) equality lookups
+    """
+
+    def __init__(self, attribute: str, unique: bool = False):
+        """ Initialize an empty index
+        """
+        self.attribute = attribute
+        self.unique = unique
+        self._ids = {}
+
+    @staticmethod
+    def indexable(value) -> bool:
+        """ Only hashable values are indexed
+        """
+        return isinstance(value, Hashable)
+
+    def add(self, obj_id: str, value):
+        """ Index an object id under a value
+        """
+        if value is None or not self.indexable(value):
+            return
+        self._ids.setdefault(value, {})[obj_id] = None
+
+    def extend(self, entries: Iterable[Tuple[str, object]]):
+        """ Index (id, value) pairs, e.g. to build the index
+        """
+        for obj_id, value in entries:
+            self.add(obj_id, value)
+
+    def discard(self, obj_id: str, value):
+        """ Remove an object id from under a value
+        """
+        if value is None or not self.indexable(value):
+            return
+        ids = self._ids.get(value)
+        if ids is not None:
+            ids.pop(obj_id, None)
+            if not ids:
+                del self._ids[value]
+
+    def lookup(self, value) -> Iterable[str]:
+        """ Ids of the objects holding a value
+        """
+        return list(self._ids.get(value, ()))
+
+    def conflicts(self, obj_id: str, value) -> bool:
+        """ Whether another object already holds a value of a unique index
+        """
+        if not self.unique or value is None or not self.indexable(value):
+            return False
+        return any(other != obj_id for other in self._ids.get(value, ()))
+
+    def supports(self, predicate) -> bool:
+        """ Whether the index can find the ids matching a predicate
+        """
+        value = getattr(predicate, 'value', None)
+        return (predicate.kind == 'eq' and value is not None
+                and self.indexable(value))
+
+    def estimate(self, predicate) -> int:
+        """ Number of ids matching a supported predicate
+        """
+        return len(self._ids.get(predicate.value, ()))
+
+    def find(self, predicate) -> Iterable[str]:
+        """ Ids matching a supported predicate
+        """
+        return self.lookup(predicate.value)
+
+
+class SortedIndex(HashIndex):
+    """ Sorted index on one attribute: O(log n) equality, prefix and
+    range lookups on string values, timestamps included (see sort_key)
+
+    String values are kept as (key, id) pairs in a SortedList, so ids
+    holding the same value are in id order and one can be added or
+    removed without walking the others. Values of other types are only
+    hashed, as by HashIndex.
+    """
+
+    def __init__(self, attribute: str, unique: bool = False):
+        """ Initialize an empty index
+        """
+        super().__init__(attribute, unique)
+        self._entries = SortedList()
+
+    def add(self, obj_id: str, value):
+        """ Index an object id under a value
+        """
+        key = sort_key(value)
+        if type(key) is not str:
+            super().add(obj_id, value)
+            return
+        self._entries.add((key, obj_id))
+
+    def extend(self, entries: Iterable[Tuple[str, object]]):
+        """ Index (id, value) pairs, sorting them at once
+        """
+        keyed = list(self._entries)
+        for obj_id, value in entries:
+            key = sort_key(value)
+            if type(key) is str:
+                keyed.append((key, obj_id))
+            else:
+                super().add(obj_id, value)
+        self._entries = SortedList(keyed)
+
+    def discard(self, obj_id: str, value):
+        """ Remove an object id from under a value
+        """
+        key = sort_key(value)
+        if type(key) is not str:
+            super().discard(obj_id, value)
+            return
+        self._entries.remove((key, obj_id))
+
+    def lookup(self, value) -> Iterable[str]:
+        """ Ids of the objects holding a value
+        """
+        key = sort_key(value)
+        if type(key) is not str:
+            return super().lookup(value)
+        return [obj_id for _, obj_id in self._entries.irange(
+            *self._bounds(key, key + "\0"))]
+
+    def conflicts(self, obj_id: str, value) -> bool:
+        """ Whether another object already holds a value of a unique index
+        """
+        if not self.unique or type(sort_key(value)) is not str:
+            return super().conflicts(obj_id, value)
+        return any(other != obj_id for other in self.lookup(value))
+
+    @staticmethod
+    def _bounds(start: str = None, end: str = None) -> Tuple:
+        """ Entries bounding the keys in [start, end): (key,) sorts
+        before every (key, id)
+        """
+        return (None if start is None else (start,),
+                None if end is None else (end,))
+
+    def _range(self, predicate) -> Tuple:
+        """ Entries bounding the keys matching a predicate
+        """
+        if predicate.kind == 'eq':
+            # the smallest string greater than a key is the key + "\0"
+            return self._bounds(predicate.value, predicate.value + "\0")
+        if predicate.kind == 'prefix':
+            return self._bounds(predicate.prefix,
+                                successor(predicate.prefix))
+        return self._bounds(predicate.start, predicate.end)
+
+    def supports(self, predicate) -> bool:
+        """ Whether the index can find the ids matching a predicate
+        """
+        if predicate.kind == 'eq':
+            # equal timestamps may differ below the second
+            return (not isinstance(predicate.value, datetime)
+                    and super().supports(predicate))
+        if predicate.kind == 'prefix':
+            return type(predicate.prefix) is str
+        # an unbounded range also matches the values which are hashed
+        bounds = [bound for bound in (predicate.start, predicate.end)
+                  if bound is not None]
+        return bool(bounds) and all(type(bound) is str for bound in bounds)
+
+    def estimate(self, predicate) -> int:
+        """ Number of ids matching a supported predicate
+        """
+        if predicate.kind == 'eq' and type(predicate.value) is not str:
+            return super().estimate(predicate)
+        return self._entries.count(*self._range(predicate))
+
+    def find(self, predicate) -> Iterable[str]:
+        """ Ids matching a supported predicate, in value order
+        """
+        if predicate.kind == 'eq' and type(predicate.value) is not str:
+            return super().find(predicate)
+        return [obj_id for _, obj_id in self._entries.irange(
+            *self._range(predicate))]
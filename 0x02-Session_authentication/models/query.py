@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+""" Query module
+
+Predicates of `Base.search` queries and the planner picking the
+indexes that serve them. A query maps attribute names to a plain value,
+matched by equality, or to a predicate:
+    {'email': Prefix('bob@'), 'created_at': Range(start, end)}
+"""
+from typing import List, Optional
+from models.index import sort_key
+
+
+# An index is intersected with the candidates of the most selective
+# one only while it returns at most INTERSECT_FACTOR times more ids,
+# past that checking its predicate on each candidate is cheaper
+INTERSECT_FACTOR = 8
+
+
+class Eq():
+    """ Attribute equal to a value
+    """
+
+    kind = 'eq'
+
+    def __init__(self, value):
+        """ Initialize the predicate
+        """
+        self.value = value
+
+    def match(self, value) -> bool:
+        """ Whether an attribute value satisfies the predicate
+        """
+        return value == self.value
+
+    def __repr__(self) -> str:
+        """ Readable form, as shown by explain
+        """
+        return "== {!r}".format(self.value)
+
+
+class Prefix():
+    """ String attribute starting with a prefix
+    """
+
+    kind = 'prefix'
+
+    def __init__(self, prefix: str):
+        """ Initialize the predicate
+        """
+        self.prefix = prefix
+
+    def match(self, value) -> bool:
+        """ Whether an attribute value satisfies the predicate
+        """
+        return type(value) is str and value.startswith(self.prefix)
+
+    def __repr__(self) -> str:
+        """ Readable form, as shown by explain
+        """
+        return "prefix {!r}".format(self.prefix)
+
+
+class Range():
+    """ Attribute in [start, end), either bound being optional
+
+    Timestamps are compared to the second, in their stored format,
+    whether given as datetimes or strings.
+    """
+
+    kind = 'range'
+
+    def __init__(self, start=None, end=None):
+        """ Initialize the predicate
+        """
+        self.start = sort_key(start)
+        self.end = sort_key(end)
+
+    def match(self, value) -> bool:
+        """ Whether an attribute value satisfies the predicate
+        """
+        if value is None:
+            return False
+        value = sort_key(value)
+        try:
+            return ((self.start is None or self.start <= value)
+                    and (self.end is None or value < self.end))
+        except TypeError:
+            return False
+
+    def __repr__(self) -> str:
+        """ Readable form, as shown by explain
+        """
+        return "in [{!r}, {!r})".format(self.start, self.end)
+
+
+def predicate(value):
+    """ Predicate of a query value: itself, or equality to it
+    """
+    if isinstance(value, (Eq, Prefix, Range)):
+        return value
+    return Eq(value)
+
+
+class Plan():
+    """ Plan of a query on the indexes of a class
+
+    The indexes able to serve a predicate are ranked by their estimated
+    number of ids. The most selective one gives the candidates, the next
+    ones are intersected with them (see INTERSECT_FACTOR) and the other
+    predicates are left as filters, checked on each candidate. Without
+    any usable index, every object is a candidate.
+    """
+
+    def __init__(self, query: dict, indexes: dict):
+        """ Plan a query, given the indexes of the class by attribute
+        """
+        self.predicates = {k: predicate(v) for k, v in query.items()}
+        ranked = []
+        for attr, pred in self.predicates.items():
+            index = indexes.get(attr)
+            if index is not None and index.supports(pred):
+                ranked.append((index.estimate(pred), attr, index))
+        ranked.sort(key=lambda scan: scan[0])
+        self.scans = []
+        for estimate, attr, index in ranked:
+            if (self.scans
+                    and estimate > INTERSECT_FACTOR * self.scans[0][0]):
+                break
+            self.scans.append((estimate, attr, index))
+        scanned = {attr for _, attr, _ in self.scans}
+        self.filters = {attr: pred for attr, pred in self.predicates.items()
+                        if attr not in scanned}
+
+    def candidates(self) -> Optional[List[str]]:
+        """ Ids satisfying the predicates of the index scans, in the
+        order of the first scan, or None when there is no scan
+        """
+        obj_ids = None
+        for _, attr, index in self.scans:
+            found = index.find(self.predicates[attr])
+            if obj_ids is None:
+                obj_ids = list(found)
+            else:
+                found = set(found)
+                obj_ids = [obj_id for obj_id in obj_ids if obj_id in found]
+            if not obj_ids:
+                break
+        return obj_ids
+
+    def explain(self) -> dict:
+        """ Describe the plan: index scans in order, with their
+        estimated number of ids, then the filters
+        """
+        return {
+            'scans': [{'attribute': attr,
+                       'index': type(index).__name__,
+                       'predicate': repr(self.predicates[attr]),
+                       'estimate': estimate}
+                      for estimate, attr, index in self.scans],
+            'filters': {attr: repr(pred)
+                        for attr, pred in self.filters.items()},
+            'full_scan': not self.scans,
+        }
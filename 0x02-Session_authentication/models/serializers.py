@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+""" Serializers module
+
+File formats of the model store. A serializer turns a dict of
+{id: record} into the bytes of a file and back, where a record is the
+dict of the attributes of one object. Timestamps may be given as
+datetimes, or formatted already unless the `datetimes` attribute of
+the serializer is set.
+
+Formats:
+  - JSONSerializer: the original `.db_<Class>.json` format
+  - BinarySerializer: length-prefixed binary records, with timestamps
+    stored as integer seconds
+
+Convert a snapshot (see models.snapshot) from one format to the
+other, by extension:
+    python3 -m models.serializers .db_User.json .db_User.bin
+"""
+from datetime import datetime, timedelta
+import json
+import struct
+import sys
+from typing import Iterable
+from models.snapshot import read_snapshot, write_snapshot
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class JSONSerializer():
+    """ JSON object of {id: record}, timestamps as formatted strings
+    """
+
+    extension = "json"
+    datetimes = False
+
+    def __init__(self, timestamp_format: str):
+        """ Initialize the serializer with the timestamp format
+        """
+        self.timestamp_format = timestamp_format
+
+    def _default(self, value):
+        """ Serialize the values json does not handle
+        """
+        if isinstance(value, datetime):
+            return value.strftime(self.timestamp_format)
+        raise TypeError("{} is not JSON serializable".format(
+            type(value).__name__))
+
+    def dumps(self, records: dict) -> bytes:
+        """ Encode records, in one pass of the C encoder of json
+        """
+        return json.dumps(records, default=self._default).encode('utf-8')
+
+    def loads(self, data: bytes) -> dict:
+        """ Decode the records of a file
+        """
+        return json.loads(data)
+
+
+class BinarySerializer():
+    """ Length-prefixed binary records
+
+    Layout (little endian):
+        header: magic b"HBDB", version (B), key count (H), then each
+                attribute name as length (H) + UTF-8 bytes
+        record: payload length (I), then the payload: id as
+                length (H) + UTF-8 bytes, field count (H), then each
+                field as key index (H), type tag (B) and value
+    Timestamps are stored as integer seconds and loaded as datetimes.
+    """
+
+    extension = "bin"
+    datetimes = True
+    MAGIC = b"HBDB"
+    VERSION = 1
+
+    NONE, STR, INT, TIMESTAMP, TRUE, FALSE, FLOAT, JSON = range(8)
+
+    _H = struct.Struct("<H")
+    _I = struct.Struct("<I")
+    _q = struct.Struct("<q")
+    _d = struct.Struct("<d")
+
+    def __init__(self, timestamp_format: str,
+                 timestamp_keys: Iterable[str] = ()):
+        """ Initialize the serializer
+
+        String values of `timestamp_keys` in `timestamp_format` are
+        stored as integer seconds too.
+        """
+        self.timestamp_format = timestamp_format
+        self.timestamp_keys = frozenset(timestamp_keys)
+
+    def _encode(self, key: str, value, out: bytearray):
+        """ Append the type tag and encoded value of a field
+        """
+        if value is None:
+            out.append(self.NONE)
+        elif value is True:
+            out.append(self.TRUE)
+        elif value is False:
+            out.append(self.FALSE)
+        elif type(value) is str:
+            if key in self.timestamp_keys:
+                try:
+                    value = datetime.strptime(value, self.timestamp_format)
+                except ValueError:
+                    value = None
+                if value is not None:
+                    self._encode(key, value, out)
+                    return
+            data = value.encode('utf-8')
+            out.append(self.STR)
+            out += self._I.pack(len(data))
+            out += data
+        elif type(value) is int:
+            out.append(self.INT)
+            out += self._q.pack(value)
+        elif isinstance(value, datetime):
+            out.append(self.TIMESTAMP)
+            out += self._q.pack(int((value - EPOCH).total_seconds()))
+        elif type(value) is float:
+            out.append(self.FLOAT)
+            out += self._d.pack(value)
+        else:
+            data = json.dumps(value).encode('utf-8')
+            out.append(self.JSON)
+            out += self._I.pack(len(data))
+            out += data
+
+    def dumps(self, records: dict) -> bytes:
+        """ Encode records
+        """
+        keys = {}
+        for record in records.values():
+            for key in record:
+                if key not in keys:
+                    keys[key] = len(keys)
+        header = bytearray(self.MAGIC)
+        header.append(self.VERSION)
+        header += self._H.pack(len(keys))
+        for key in keys:
+            data = key.encode('utf-8')
+            header += self._H.pack(len(data)) + data
+        out = [header]
+
+        for obj_id, record in records.items():
+            payload = bytearray()
+            data = obj_id.encode('utf-8')
+            payload += self._H.pack(len(data))
+            payload += data
+            payload += self._H.pack(len(record))
+            for key, value in record.items():
+                payload += self._H.pack(keys[key])
+                self._encode(key, value, payload)
+            out.append(self._I.pack(len(payload)))
+            out.append(payload)
+        return b"".join(out)
+
+    def loads(self, data: bytes) -> dict:
+        """ Decode the records of a binary file
+        """
+        if data[:4] != self.MAGIC or data[4] != self.VERSION:
+            raise ValueError("Not a binary model store")
+        H, I, q, d = self._H, self._I, self._q, self._d
+        pos = 5
+        (count,) = H.unpack_from(data, pos)
+        pos += 2
+        keys = []
+        for _ in range(count):
+            (size,) = H.unpack_from(data, pos)
+            pos += 2
+            keys.append(data[pos:pos + size].decode('utf-8'))
+            pos += size
+
+        records = {}
+        end = len(data)
+        while pos < end:
+            (size,) = I.unpack_from(data, pos)
+            pos += 4
+            record_end = pos + size
+            if record_end > end:
+                raise ValueError("Truncated record")
+            (id_size,) = H.unpack_from(data, pos)
+            pos += 2
+            obj_id = data[pos:pos + id_size].decode('utf-8')
+            pos += id_size
+            (fields,) = H.unpack_from(data, pos)
+            pos += 2
+            record = {}
+            for _ in range(fields):
+                (key_index,) = H.unpack_from(data, pos)
+                tag = data[pos + 2]
+                pos += 3
+                if tag == self.NONE:
+                    value = None
+                elif tag == self.STR or tag == self.JSON:
+                    (size,) = I.unpack_from(data, pos)
+                    pos += 4
+                    value = data[pos:pos + size].decode('utf-8')
+                    pos += size
+                    if tag == self.JSON:
+                        value = json.loads(value)
+                elif tag == self.INT:
+                    (value,) = q.unpack_from(data, pos)
+                    pos += 8
+                elif tag == self.TIMESTAMP:
+                    (value,) = q.unpack_from(data, pos)
+                    value = EPOCH + timedelta(seconds=value)
+                    pos += 8
+                elif tag == self.TRUE:
+                    value = True
+                elif tag == self.FALSE:
+                    value = False
+                elif tag == self.FLOAT:
+                    (value,) = d.unpack_from(data, pos)
+                    pos += 8
+                else:
+                    raise ValueError("Unknown type tag {}".format(tag))
+                record[keys[key_index]] = value
+            if pos != record_end:
+                raise ValueError("Corrupted record {}".format(obj_id))
+            records[obj_id] = record
+        return records
+
+
+def convert(src: str, dst: str, serializers: dict):
+    """ Convert a store file to another format, picked by extension
+    """
+    by_extension = {s.extension: s for s in serializers.values()}
+    reader = by_extension[src.rsplit('.', 1)[-1]]
+    writer = by_extension[dst.rsplit('.', 1)[-1]]
+    write_snapshot(dst, writer, read_snapshot(src, reader))
+
+
+if __name__ == "__main__":
+    from models.base import SERIALIZERS
+    if len(sys.argv) != 3:
+        print("Usage: python3 -m models.serializers SRC DST")
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2], SERIALIZERS)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+""" SQLite store module
+
+Storage backend keeping the objects of the model classes in a SQLite
+database instead of in memory: nothing is loaded at startup, objects
+are built from their row when read.
+
+Each class has a table named after it, holding the id, the timestamps
+and the attributes of the INDEXES of the class as columns (the latter
+indexed, UNIQUE when the index is unique), and every attribute as
+`to_json(True)` JSON in `data`:
+    CREATE TABLE "User" (id TEXT PRIMARY KEY, "created_at",
+                         "updated_at", "email", data TEXT NOT NULL)
+
+A table is filled on creation with the objects kept in the files of
+the class (see Base.file_records), so switching DB_STORAGE from 'file'
+to 'sqlite' keeps them. Objects conflicting with a unique column are
+skipped, and reported on stderr.
+"""
+import json
+import sqlite3
+import sys
+import threading
+from typing import Iterable, List, TypeVar
+from models.index import sort_key
+from models.query import predicate
+
+
+def _column_value(value):
+    """ Value of a column: scalars as is, timestamps as stored, other
+    values as JSON
+    """
+    value = sort_key(value)
+    if value is None or type(value) in (str, int, float, bool):
+        return value
+    return json.dumps(value)
+
+
+class SQLiteStore():
+    """ Objects of the model classes, in a SQLite database
+
+    Each thread has its own connection. The database is in WAL mode, so
+    several processes may share it, and readers do not wait for writers.
+    """
+
+    def __init__(self, db_path: str):
+        """ Initialize a store on a database file, created on first use
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._tables = set()
+        self._tables_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def columns(cls: type) -> List[str]:
+        """ Attributes of a class stored in their own column
+        """
+        columns = ['created_at', 'updated_at']
+        return columns + [attr for attr in cls.INDEXES if attr not in columns]
+
+    def _table(self, cls: type) -> str:
+        """ Return the quoted table of a class, created on first use and
+        filled with the objects of the files of the class
+        """
+        table = '"{}"'.format(cls.__name__)
+        if cls.__name__ in self._tables:
+            return table
+        with self._tables_lock:
+            conn = self._connection()
+            with conn:
+                # another process may be creating the table as well
+                conn.execute("BEGIN IMMEDIATE")
+                created = not self._exists(conn, cls.__name__)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY KEY, {},"
+                    " data TEXT NOT NULL)".format(table, ", ".join(
+                        '"{}"'.format(c) for c in self.columns(cls))))
+                for attr, options in cls.INDEXES.items():
+                    conn.execute(
+                        'CREATE {}INDEX IF NOT EXISTS "{}_{}" ON {} ("{}")'
+                        .format("UNIQUE " if options.get('unique') else "",
+                                cls.__name__, attr, table, attr))
+                if created:
+                    self._import(conn, cls, table)
+            self._tables.add(cls.__name__)
+        return table
+
+    def _import(self, conn: sqlite3.Connection, cls: type, table: str):
+        """ Insert the objects of the files of a class into its table
+        """
+        sql = self._upsert(cls, table)
+        for record in cls.file_records().values():
+            obj = cls(**record)
+            try:
+                conn.execute(sql, self._row(obj))
+            except sqlite3.IntegrityError as e:
+                print("Skipping {} {}: {}".format(
+                    cls.__name__, obj.id, self._error(cls, e)),
+                    file=sys.stderr)
+
+    @staticmethod
+    def _exists(conn: sqlite3.Connection, s_class: str) -> bool:
+        """ Whether the table of a class exists in a database
+        """
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (s_class,)).fetchone()
+        return row is not None
+
+    def exists(self, s_class: str) -> bool:
+        """ Whether the table of a class exists, only looked up until it
+        does
+        """
+        if s_class in self._tables:
+            return True
+        return self._exists(self._connection(), s_class)
+
+    def _upsert(self, cls: type, table: str) -> str:
+        """ Statement inserting or updating the row of an object
+        """
+        columns = self.columns(cls)
+        names = ", ".join('"{}"'.format(c) for c in columns)
+        updates = ", ".join('"{0}" = excluded."{0}"'.format(c)
+                            for c in columns + ['data'])
+        return ("INSERT INTO {} (id, {}, data) VALUES ({}) ON CONFLICT(id)"
+                " DO UPDATE SET {}".format(
+                    table, names, ", ".join("?" * (len(columns) + 2)),
+                    updates))
+
+    def _row(self, obj: TypeVar('Base')) -> list:
+        """ Values of the row of an object
+        """
+        record = obj.to_json(True)
+        values = [obj.id] + [_column_value(record.get(c))
+                             for c in self.columns(obj.__class__)]
+        values.append(json.dumps(record))
+        return values
+
+    def _error(self, cls: type, error: sqlite3.IntegrityError) -> str:
+        """ Message of a constraint violated by a row
+        """
+        for attr in self.columns(cls):
+            if '.{}'.format(attr) in str(error):
+                return "{} already exists".format(attr)
+        return str(error)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update the row of an object
+
+        Raises a ValueError when a unique column already holds the value
+        of this object for another object.
+        """
+        cls = obj.__class__
+        sql = self._upsert(cls, self._table(cls))
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute(sql, self._row(obj))
+        except sqlite3.IntegrityError as e:
+            raise ValueError(self._error(cls, e))
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete the row of an object
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM {} WHERE id = ?".format(
+                self._table(obj.__class__)), (obj.id,))
+
+    def _objects(self, cls: type, rows: Iterable) -> Iterable:
+        """ Build the objects of rows of (data,)
+        """
+        for (data,) in rows:
+            yield cls(**json.loads(data))
+
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        rows = self._connection().execute(
+            "SELECT data FROM {} WHERE id = ?".format(self._table(cls)),
+            (obj_id,))
+        return next(self._objects(cls, rows), None)
+
+    def count(self, cls: type) -> int:
+        """ Count all objects of a class
+        """
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM {}".format(self._table(cls))).fetchone()[0]
+
+    def page(self, cls: type, limit: int,
+             after: str = None) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects in id order, after the id `after`
+        """
+        rows = self._connection().execute(
+            "SELECT data FROM {} WHERE id > ? ORDER BY id LIMIT ?".format(
+                self._table(cls)), ("" if after is None else after, limit))
+        return list(self._objects(cls, rows))
+
+    def _query(self, cls: type, attributes: dict):
+        """ Split a query into a SQL condition with its parameters, and
+        the predicates left to check on each object
+        """
+        columns = self.columns(cls)
+        conditions = []
+        params = []
+        filters = {}
+        for attr, pred in ((k, predicate(v)) for k, v in attributes.items()):
+            column = '"{}"'.format(attr)
+            if attr not in columns:
+                filters[attr] = pred
+            elif pred.kind == 'eq' and pred.value is None:
+                conditions.append("{} IS NULL".format(column))
+            elif (pred.kind == 'eq'
+                    and type(sort_key(pred.value)) in (str, int, float)):
+                conditions.append("{} = ?".format(column))
+                params.append(sort_key(pred.value))
+            elif pred.kind == 'prefix' and type(pred.prefix) is str:
+                conditions.append("{} >= ?".format(column))
+                params.append(pred.prefix)
+                if pred.prefix and pred.prefix[-1] != chr(0x10ffff):
+                    # values starting with the prefix sort before its
+                    # successor
+                    conditions.append("{} < ?".format(column))
+                    params.append(pred.prefix[:-1]
+                                  + chr(ord(pred.prefix[-1]) + 1))
+            elif (pred.kind == 'range' and
+                    all(bound is None or type(bound) is str
+                        for bound in (pred.start, pred.end))):
+                conditions.append("{} >= ?".format(column))
+                params.append(pred.start or "")
+                if pred.end is not None:
+                    conditions.append("{} < ?".format(column))
+                    params.append(pred.end)
+            else:
+                filters[attr] = pred
+        sql = "SELECT data FROM {}".format(self._table(cls))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return sql, params, filters
+
+    def search(self, cls: type,
+               attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes, see Base.search
+        """
+        sql, params, filters = self._query(cls, attributes)
+        rows = self._connection().execute(sql, params)
+        return [obj for obj in self._objects(cls, rows)
+                if all(pred.match(getattr(obj, k))
+                       for k, pred in filters.items())]
+
+    def explain(self, cls: type, attributes: dict = {}) -> dict:
+        """ Return the plan of a search: the query plan of SQLite, and
+        the attributes checked on each object
+        """
+        sql, params, filters = self._query(cls, attributes)
+        rows = self._connection().execute("EXPLAIN QUERY PLAN " + sql,
+                                          params)
+        return {
+            'sql': sql,
+            'plan': [row[-1] for row in rows],
+            'filters': {attr: repr(pred) for attr, pred in filters.items()},
+        }
@@ -2,7 +2,7 @@
 """
 User Session module
 """
-from models.base import Base
+from models.base import Base, COMPACT
 
 
 class UserSession(Base):
@@ -10,6 +10,11 @@ class UserSession(Base):
     User Session class
     """
 
+    INDEXES = dict(Base.INDEXES, session_id={'unique': True}, user_id={})
+    INTERNED = ('user_id',)
+    if COMPACT:
+        __slots__ = ('user_id', 'session_id')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User Session instance
         """